@@ -0,0 +1,36 @@
+"""
+Hull benchmark: Langton's ant on day11_robot.Hull, a painter no fixed grid holds.
+Turn right on black, left on white, flip the panel, move; after ~10000 steps the ant
+builds a highway and walks away for good, chunks are allocated along its trail only
+
+run from the repo root: python benchmarks/hull.py
+"""
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from day11_robot import Hull, CHUNK
+
+def langton(steps: int) -> Hull:
+    hull = Hull()
+    x = y = 0
+    dx, dy = 0, 1
+    for _ in range(steps):
+        colour = hull.colour(x, y)
+        dx, dy = (-dy, dx) if colour else (dy, -dx)
+        hull.paint(x, y, 1 - colour)
+        x, y = x + dx, y + dy
+    return hull
+
+if __name__ == "__main__":
+    for steps in (1_000_000, 3_000_000):
+        start = time.perf_counter()
+        ant = langton(steps)
+        seconds = time.perf_counter() - start
+        left, bottom, right, top = ant.bounds
+        print(f"ant {steps} steps in {seconds:.2f} s ({steps / seconds:,.0f} steps/s): {len(ant)} panels "
+              f"in {right - left + 1}x{top - bottom + 1}, {len(ant.chunks)} chunks, "
+              f"{len(ant.chunks) * CHUNK * CHUNK // 4} bytes of bitsets")
@@ -0,0 +1,129 @@
+"""
+Memory backend benchmark: intcode.Memory against the old defaultdict memory
+on the day09 BOOST program (part 2, sensor boost mode)
+
+run from the repo root: python benchmarks/memory_backend.py
+"""
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Tuple, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import intcode
+
+Access = Tuple[int, int] # (address, value) value is None for reads
+
+def dict_memory(program: List[int]) -> defaultdict:
+    memory = defaultdict(lambda: 0)
+    memory.update({pos:val for pos, val in enumerate(program)})
+    return memory
+
+class RecordingMemory(intcode.Memory):
+    """Memory that logs every access so it can be replayed against other backends"""
+    __slots__ = ('log',)
+
+    def __init__(self, program: List[int]):
+        super().__init__(program)
+        self.log: List[Access] = []
+
+    def __getitem__(self, address: int) -> int:
+        self.log.append((address, None))
+        return super().__getitem__(address)
+
+    def __setitem__(self, address: int, value: int) -> None:
+        self.log.append((address, value))
+        super().__setitem__(address, value)
+
+class DictIntcode(intcode.Intcode):
+    """
+    The interpreter as it was before Memory: a defaultdict read through __getitem__,
+    instruction fetches included (cells is the dict too).
+    Pinned to the interpreter, the other engines compile from the flat list and never touch the dict
+    """
+    def __init__(self, program: List[int], make_memory: Callable = dict_memory):
+        super().__init__(program, engine='interpreter')
+        self.program = self.cells = make_memory(program)
+
+    def handle_mode(self, pos: int, mode: int) -> int:
+        immediate_parameter = self.program[pos]
+        if mode == 0:
+            return self.program[immediate_parameter]
+        elif mode == 1:
+            return immediate_parameter
+        return self.program[immediate_parameter + self.relative_base]
+
+    def _loc(self, pos: int, mode: int) -> int:
+        immediate_parameter = self.program[pos]
+        return immediate_parameter if mode == 0 else immediate_parameter + self.relative_base
+
+# the first instruction turns the input instruction after it into a halt, fetches have to see the write
+_SELF_MODIFYING = [1101, 0, 99, 4, 3, 0, 99]
+for _machine in (DictIntcode(_SELF_MODIFYING), DictIntcode(_SELF_MODIFYING, RecordingMemory),
+                 intcode.Intcode(_SELF_MODIFYING, engine='interpreter')):
+    assert _machine.run() == intcode.Status.HALTED and _machine.program[4] == 99
+
+def run_boost(machine: intcode.Intcode) -> List[int]:
+    machine.inputs.append(2)
+    machine.run()
+    return machine.outputs
+
+def time_run(program: List[int], machine_class: Callable) -> Tuple[float, List[int]]:
+    machine = machine_class(program)
+    start = time.perf_counter()
+    outputs = run_boost(machine)
+    return time.perf_counter() - start, outputs
+
+def time_replay(program: List[int], log: List[Access], make_memory: Callable) -> float:
+    memory = make_memory(program)
+    start = time.perf_counter()
+    for address, value in log:
+        if value is None:
+            memory[address]
+        else:
+            memory[address] = value
+    return time.perf_counter() - start
+
+def time_replay_cells(program: List[int], log: List[Access]) -> float:
+    """Replay the way the interpreter reads: flat list first, Memory past the end"""
+    memory = intcode.Memory(program)
+    cells = memory.cells
+    start = time.perf_counter()
+    for address, value in log:
+        if value is None:
+            try:
+                cells[address]
+            except IndexError:
+                memory[address]
+        else:
+            memory[address] = value
+    return time.perf_counter() - start
+
+def best_of(repeat: int, fn: Callable, *args) -> float:
+    return min(fn(*args) for _ in range(repeat))
+
+if __name__ == "__main__":
+    with open(ROOT / "day09_puzzle.txt", 'r') as file:
+        program = intcode.problem_prep(file.read())
+
+    recorder = DictIntcode(program, RecordingMemory) # every fetch, read and write through __getitem__/__setitem__
+    run_boost(recorder)
+    log = recorder.program.log
+    print(f"BOOST part 2: {len(log)} memory accesses")
+
+    replays = {
+        'defaultdict': best_of(5, time_replay, program, log, dict_memory),
+        'Memory': best_of(5, time_replay, program, log, intcode.Memory),
+        'Memory.cells': best_of(5, time_replay_cells, program, log),
+    }
+    for name, replay in replays.items():
+        print(f"{name:>12}: replay {replay * 1000:8.1f} ms  ({len(log) / replay / 1e6:5.1f} M accesses/s)")
+
+    # both on the interpreter, so only the memory backend differs
+    for name, machine_class in (('defaultdict', DictIntcode),
+                                ('Memory', lambda program: intcode.Intcode(program, engine='interpreter'))):
+        run, outputs = min(time_run(program, machine_class) for _ in range(3))
+        print(f"{name:>12}: full run {run:6.2f} s  outputs {outputs}")
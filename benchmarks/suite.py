@@ -0,0 +1,214 @@
+"""
+Intcode benchmark suite: every engine on fixed puzzle workloads
+reports instructions per second, peak memory (tracemalloc, separate pass) and startup time
+(reading + parsing the input and building the first machine), results can be saved as JSON
+and compared against a stored baseline, the exit code is 1 on a regression
+
+run from the repo root:
+    python benchmarks/suite.py --save benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --tolerance 0.15
+    python benchmarks/suite.py --workloads day05 day09 --engines closure jit --no-memory
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List, Dict, Callable, NamedTuple, Iterator, Any, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import intcode
+from intcode_image import load_program
+import day05_alarm2
+import day07_amps2
+import day09_sensor2
+import day11_robot
+import day13_breakout2
+import day13_headless
+
+class Workload(NamedTuple):
+    name: str
+    input_file: str
+    run: Callable[[List[int]], Any] # program -> answer
+    expected: Any # answer on the puzzle input, checked on every run
+
+MIN_SECONDS = 0.05 # a workload is run back to back until a timing lasts this long, timer noise stays small
+
+class Result(NamedTuple):
+    workload: str
+    engine: str
+    seconds: float # one run, best of the repeats
+    instructions: int
+    instructions_per_second: float
+    peak_bytes: Optional[int] # None when the memory pass was skipped
+    startup_seconds: float
+    answer: Any
+
+@contextlib.contextmanager
+def track_machines(engine: str) -> Iterator[List[intcode.Intcode]]:
+    """Every machine built inside runs on engine and is collected, whichever module builds it"""
+    machines = []
+    default, init = intcode.DEFAULT_ENGINE, intcode.Intcode.__init__
+
+    def tracked_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        machines.append(self)
+
+    intcode.DEFAULT_ENGINE, intcode.Intcode.__init__ = engine, tracked_init
+    try:
+        yield machines
+    finally:
+        intcode.DEFAULT_ENGINE, intcode.Intcode.__init__ = default, init
+
+def day02_sweep(program: List[int]) -> List[int]:
+    """Full 100 x 100 noun/verb sweep on one machine restored between runs, no symbolic shortcut"""
+    machine = intcode.Intcode(program)
+    start = machine.snapshot()
+    hits = []
+    for noun, verb in itertools.product(range(100), range(100)):
+        machine.restore(start)
+        machine.poke(1, noun)
+        machine.poke(2, verb)
+        machine.run()
+        if machine.program[0] == 19690720:
+            hits.append(100 * noun + verb)
+    return hits
+
+def day05_diagnostics(program: List[int]) -> List[int]:
+    return [day05_alarm2.intcode(program, ID=1)[-1], day05_alarm2.intcode2(program, ID=5)[-1]]
+
+def day07_feedback(program: List[int]) -> int:
+    """All 120 feedback loops simulated in full, no stage cache"""
+    return max(day07_amps2.run_amplifiers(program, list(phases)) for phases in itertools.permutations(range(5, 10)))
+
+def day09_boost(program: List[int]) -> List[int]:
+    return day09_sensor2.run_sensor(program, [2])
+
+def day11_robot_panels(program: List[int]) -> int:
+    return day11_robot.run_intcode(program, part2=False)
+
+def day13_breakout(program: List[int]) -> int:
+    breakout = day13_breakout2.Breakout(program)
+    with contextlib.redirect_stdout(None):
+        breakout(2)
+    return breakout.score
+
+def day13_headless_game(program: List[int]) -> int:
+    """The same game with the predictive paddle, no printing or screen work in the loop"""
+    return day13_headless.play(program).score
+
+WORKLOADS = {workload.name: workload for workload in [
+    Workload('day02', 'day02_inputs.txt', day02_sweep, [5741]),
+    Workload('day05', 'day05_inputs.txt', day05_diagnostics, [4601506, 5525561]),
+    Workload('day07', 'day07_input.txt', day07_feedback, 21844737),
+    Workload('day09', 'day09_puzzle.txt', day09_boost, [73144]),
+    Workload('day11', 'day11_puzzle.txt', day11_robot_panels, 1709),
+    Workload('day13', 'day13_puzzle_input.txt', day13_breakout, 14538),
+    Workload('day13h', 'day13_puzzle_input.txt', day13_headless_game, 14538),
+]}
+
+def startup(workload: Workload, engine: str) -> float:
+    """Loading the input the way the day scripts do (through the image cache, warmed by measure) and the first machine"""
+    start = time.perf_counter()
+    program = load_program(ROOT / workload.input_file)
+    intcode.Intcode(program, engine=engine)
+    return time.perf_counter() - start
+
+def measure(workload: Workload, engine: str, repeat: int, memory: bool) -> Result:
+    program = load_program(ROOT / workload.input_file)
+    with track_machines(engine) as machines:
+        start = time.perf_counter()
+        answer = workload.run(program)
+        first = time.perf_counter() - start
+    instructions = sum(machine.instructions for machine in machines)
+    # short workloads (day05 is a few hundred instructions) are timed over enough runs to reach MIN_SECONDS
+    runs = int(MIN_SECONDS / max(first, 1e-6)) + 1 if first < MIN_SECONDS else 1
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with track_machines(engine):
+            for _ in range(runs):
+                answer = workload.run(program)
+        seconds = (time.perf_counter() - start) / runs
+        if answer != workload.expected:
+            raise AssertionError(f"{workload.name} on {engine} answered {answer}, expected {workload.expected}")
+        best = seconds if best is None else min(best, seconds)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        with track_machines(engine):
+            workload.run(program)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return Result(workload=workload.name, engine=engine, seconds=best, instructions=instructions,
+                  instructions_per_second=instructions / best, peak_bytes=peak,
+                  startup_seconds=min(startup(workload, engine) for _ in range(repeat)), answer=answer)
+
+def import_seconds(repeat: int = 3) -> float:
+    """Time to import intcode in a fresh interpreter (its module level checks included) over a bare start"""
+    def run(code: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        return time.perf_counter() - start
+    return min(run("import intcode") for _ in range(repeat)) - min(run("pass") for _ in range(repeat))
+
+def compare(results: List[Result], baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions against baseline: throughput down by more than tolerance or a different answer"""
+    previous = {(entry['workload'], entry['engine']): entry for entry in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result.workload, result.engine))
+        if old is None:
+            continue
+        ratio = result.instructions_per_second / old['instructions_per_second']
+        print(f"{result.workload:>6} {result.engine:>12}: {ratio:6.2f}x baseline throughput")
+        if ratio < 1 - tolerance:
+            regressions.append(f"{result.workload} on {result.engine}: {ratio:.2f}x baseline throughput")
+        if result.answer != old['answer']:
+            regressions.append(f"{result.workload} on {result.engine}: answer {result.answer} != {old['answer']}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--engines', nargs='+', choices=intcode.ENGINES, default=list(intcode.ENGINES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--save', type=Path, help="write the results as JSON")
+    parser.add_argument('--baseline', type=Path, help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed throughput drop, 0.10 is 10%%")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'workload':>8} {'engine':>12} {'seconds':>9} {'instructions':>13} {'M instr/s':>10} "
+          f"{'peak MB':>8} {'startup ms':>11}")
+    for name in args.workloads:
+        for engine in args.engines:
+            result = measure(WORKLOADS[name], engine, args.repeat, not args.no_memory)
+            results.append(result)
+            peak = "-" if result.peak_bytes is None else f"{result.peak_bytes / 2 ** 20:.1f}"
+            print(f"{result.workload:>8} {result.engine:>12} {result.seconds:9.3f} {result.instructions:13} "
+                  f"{result.instructions_per_second / 1e6:10.2f} {peak:>8} {result.startup_seconds * 1000:11.2f}")
+    imported = import_seconds()
+    print(f"import intcode: {imported * 1000:.0f} ms")
+
+    if args.save:
+        report = {'python': platform.python_version(), 'platform': platform.platform(),
+                  'import_seconds': imported, 'results': [result._asdict() for result in results]}
+        args.save.write_text(json.dumps(report, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,13 @@
 https://adventofcode.com/2019/day/2
 """
 
-from typing import List, NamedTuple, Iterator
+from typing import List, NamedTuple, Iterator, Iterable, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import itertools
+import os
+from intcode import Intcode
+from intcode_image import load_program
+from intcode_symbolic import analyse, evaluate, linear_form
 
 class Command(NamedTuple):
     pointer: int
@@ -31,48 +36,154 @@ def intcode(inputs: List[int], noun:int=0, verb:int=0) -> int:
     Return value at position 0 once 
     opcode 99 is found. 
     """
-    inputs = inputs.copy() # required for part 2
-    inputs[1] = noun # as defined in the problem noun & verb inputs
-    inputs[2] = verb 
-    commands = instructions(inputs)
-    for command in commands:
-        if command.opcode == 99:
-            return inputs[0]
-        elif command.opcode == 1:
-             inputs[command.pos_final] = inputs[command.pos_1] + inputs[command.pos_2]
-        elif command.opcode == 2:
-             inputs[command.pos_final] = inputs[command.pos_1] * inputs[command.pos_2]
-        else:
-            raise RuntimeError(f"invalid opcode {command.opcode}")
+    machine = Intcode(inputs, engine='interpreter') # one short run, compiling would not pay off
+    machine.poke(1, noun) # as defined in the problem noun & verb inputs
+    machine.poke(2, verb)
+    machine.run()
+    return machine.program[0]
     
 assert intcode(TEST_INPUT, noun=TEST_INPUT[1], verb=TEST_INPUT[2]) == 3500
 
-def problem_prep(problem_input: str) -> List[int]:
-    inputs = [int(num) for num in problem_input.split(",")]
-    return inputs
-
 # PART 2
 
+class NounVerb(NamedTuple):
+    noun: int
+    verb: int
+
+Affine = Tuple[int, int, int] # position 0 == a * noun + b * verb + c
+
+def _search_batch(program: List[int], target: int, pairs: List[Tuple[int, int]], find_all: bool) -> List[NounVerb]:
+    """
+    Runs a batch of noun/verb pairs on one machine, restoring its start snapshot between runs
+    """
+    machine = Intcode(program, engine='interpreter')
+    start = machine.snapshot()
+    hits = []
+    for noun, verb in pairs:
+        machine.restore(start)
+        machine.poke(1, noun)
+        machine.poke(2, verb)
+        machine.run()
+        if machine.program[0] == target:
+            hits.append(NounVerb(noun, verb))
+            if not find_all:
+                break
+    return hits
+
+def fit_affine(program: List[int], nouns: List[int], verbs: List[int]) -> Optional[Affine]:
+    """
+    Fits position 0 as an affine function of noun and verb from three runs,
+    then checks the fit on a few more points of the space. None when it isn't affine
+    """
+    if len(nouns) < 2 or len(verbs) < 2:
+        return None
+    n0, n1, v0, v1 = nouns[0], nouns[1], verbs[0], verbs[1]
+    base = intcode(program, n0, v0)
+    a, a_rest = divmod(intcode(program, n1, v0) - base, n1 - n0)
+    b, b_rest = divmod(intcode(program, n0, v1) - base, v1 - v0)
+    if a_rest or b_rest:
+        return None
+    c = base - a * n0 - b * v0
+    probes = [(nouns[-1], verbs[-1]), (nouns[len(nouns) // 2], verbs[-1]), (nouns[-1], verbs[len(verbs) // 2])]
+    if any(intcode(program, noun, verb) != a * noun + b * verb + c for noun, verb in probes):
+        return None
+    return a, b, c
+
+def closed_form_search(program: List[int], target: int, nouns: List[int], verbs: List[int]) -> Optional[List[NounVerb]]:
+    """
+    Runs the program once with noun and verb symbolic, if no branch or address depended on them
+    position 0 is a closed form: solved directly when affine, evaluated per pair otherwise.
+    None when the program is too branchy for that
+    """
+    analysis = analyse(program, {1: 'noun', 2: 'verb'})
+    if not analysis.exact:
+        return None
+    position0 = analysis.memory.get(0, program[0])
+    form = linear_form(position0)
+    if form is not None:
+        coefficients, constant = form
+        return solve_affine((coefficients.get('noun', 0), coefficients.get('verb', 0), constant), target, nouns, verbs)
+    return [NounVerb(noun, verb) for noun, verb in itertools.product(nouns, verbs)
+            if evaluate(position0, {'noun': noun, 'verb': verb}) == target]
+
+def solve_affine(affine: Affine, target: int, nouns: List[int], verbs: List[int]) -> List[NounVerb]:
+    a, b, c = affine
+    verb_set = set(verbs)
+    hits = []
+    for noun in nouns:
+        rest = target - c - a * noun
+        if b == 0:
+            hits.extend(NounVerb(noun, verb) for verb in verbs if rest == 0)
+        elif rest % b == 0 and rest // b in verb_set:
+            hits.append(NounVerb(noun, rest // b))
+    return hits
+
+def search(program: List[int], target: int, nouns: Iterable[int] = range(100), verbs: Iterable[int] = range(100),
+           find_all: bool = False, workers: Optional[int] = None, batch_size: int = 500,
+           symbolic: bool = True) -> List[NounVerb]:
+    """
+    Finds the noun/verb pairs leaving target at position 0.
+    If position 0 has a closed form in noun and verb, or fits an affine one, the pairs are solved for directly,
+    otherwise batches of pairs are spread over a process pool (workers=1 searches in process).
+    Without find_all the search stops at the lowest hit in noun/verb order, the same one
+    whichever batch finishes first: only the batches after the lowest one with a hit are cancelled
+    """
+    nouns, verbs = list(nouns), list(verbs)
+    if symbolic:
+        hits = closed_form_search(program, target, nouns, verbs)
+        if hits is None:
+            affine = fit_affine(program, nouns, verbs)
+            hits = None if affine is None else solve_affine(affine, target, nouns, verbs)
+        if hits is not None:
+            return hits if find_all else hits[:1]
+    pairs = list(itertools.product(nouns, verbs))
+    batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+    if workers == 1:
+        hits = []
+        for batch in batches:
+            hits.extend(_search_batch(program, target, batch, find_all))
+            if hits and not find_all:
+                return hits[:1]
+        return hits
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    try:
+        futures = {executor.submit(_search_batch, program, target, batch, find_all): index
+                   for index, batch in enumerate(batches)}
+        found = {} # batch index -> its hits
+        lowest = len(batches) # first batch with a hit so far
+        for future in as_completed(futures):
+            index = futures[future]
+            found[index] = future.result()
+            if found[index]:
+                lowest = min(lowest, index)
+            if not find_all and lowest < len(batches) and all(earlier in found for earlier in range(lowest)):
+                return found[lowest][:1]
+        return sorted(hit for hits in found.values() for hit in hits)
+    finally:
+        # batches still queued when the answer is known are dropped instead of waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+
+TEST_AFFINE = [1,0,0,3,2,1,17,0,1,0,2,0,99,0,0,0,0,3] # position 0 ends as 3 * noun + verb
+assert fit_affine(TEST_AFFINE, list(range(10)), list(range(10))) == (3, 1, 0)
+assert search(TEST_AFFINE, 7, range(10), range(10), find_all=True) == [(0, 7), (1, 4), (2, 1)]
+assert closed_form_search(TEST_INPUT, 3500, range(12), range(12)) == [(9, 10), (10, 9)]
+assert search(TEST_AFFINE, 7, range(10), range(10), find_all=True, symbolic=False, workers=1) == [(0, 7), (1, 4), (2, 1)]
+assert search(TEST_AFFINE, 7, range(10), range(10), symbolic=False, workers=1) == [(0, 7)]
+
 def inputs_brute_force(inputs: List[int]) -> int:
     """
     finds the input pairs between 0 - 99 inclusive 
     that produce an output of 19690720
     """
-    input_pairs = itertools.permutations(range(0,100), 2) # pairs between 0 and 99 inclusive
-    while True:
-        noun, verb = next(input_pairs)
-        if intcode(inputs, noun=noun, verb=verb) == 19690720:
-            return 100 * noun + verb
-            break
+    noun, verb = search(inputs, 19690720, range(0, 100), range(0, 100))[0] # pairs between 0 and 99 inclusive
+    return 100 * noun + verb
 
 if __name__ == "__main__":
-    with open("day02_inputs.txt") as file:
-        problem_input = file.read()
-        inputs = problem_prep(problem_input)
-        part_1 = intcode(inputs, noun=12, verb=2)
-        part_2 = inputs_brute_force(inputs)
-        print("PART 1 halt code pos 0->", part_1)
-        print("PART 2 value based on input pairs is->", part_2)
+    inputs = load_program("day02_inputs.txt")
+    part_1 = intcode(inputs, noun=12, verb=2)
+    part_2 = inputs_brute_force(inputs)
+    print("PART 1 halt code pos 0->", part_1)
+    print("PART 2 value based on input pairs is->", part_2)
 
 
 
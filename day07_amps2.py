@@ -6,161 +6,35 @@ As Joel Grus solution was apealing  to me on how to use classes for this.
 
 
 
-from typing import Iterator, Generator, Tuple, List, NamedTuple
-from intcode import problem_prep, Parameters, Instructions
-from enum import Enum
+from typing import Iterator, Iterable, Generator, Tuple, List, NamedTuple, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from intcode import Intcode, Snapshot, Status, Network, NetworkState, ring
+from intcode_image import load_program
 import itertools
-import logging
-from collections import deque
-
-logging.basicConfig(level=logging.INFO)
-
-# Enum for machine with set states
-class Opcode(Enum): 
-    ADD = 1
-    MULTIPLY = 2
-    STORE_INPUT = 3
-    SEND_TO_OUTPUT = 4
-    JUMP_IF_TRUE = 5 
-    JUMP_IF_FALSE = 6
-    LESS_THAN = 7
-    EQUALS = 8
-    PROGRAM_HALT = 99
-
-    def parameter_support(self):
-        return True if self.value in (1,2,5,6,7,8) else False
-
-def parse_opcode(input: int) -> Parameters:
-    padded = f"{input:05}"
-    return Parameters(opcode= Opcode(int(padded[-2:])), 
-                      mod1= int(padded[-3]), 
-                      mod2=int(padded[-4]), 
-                      mod3=int(padded[-5]))   
-
-def parse_instructions2(pos:int, program:List[int])-> Instructions:
-    params = parse_opcode(program[pos])
-    opcode = params.opcode
-    if opcode == Opcode.PROGRAM_HALT or opcode == Opcode.SEND_TO_OUTPUT:
-        return Instructions(parameters = params)
-    elif opcode == Opcode.JUMP_IF_TRUE or  opcode == Opcode.JUMP_IF_FALSE:
-        return Instructions(parameters = params,
-                            val1=program[pos + 1],
-                            val2 =program[pos + 2])
-    else:
-        return Instructions(parameters=params,
-                            val1=program[pos + 1],
-                            val2=program[pos + 2],
-                            val3=program[pos + 3])
-
-
-Modes = List[int]
-Program = List[int]
+import os
 
-class EndProgram(Exception):
-    """Not implemented""" 
-    pass
-    
+Program = List[int]
 
 def get_phase_settings(arange:Iterator[int]=range(5,10), size:int=5) -> Generator:
     parameters = itertools.permutations(arange, size)
     for p in parameters:
         yield p
 
-class Amplifier:
-    """ Amplifier is a machine that needs to keep its state
-    Phase provided to Amplifier once only for 5 amps
-    position and program is kept for each iteration
+def run_amplifiers(program: List[int], phases: List[int]) -> int:
     """
-    def __init__(self, program: Program, phase: int) -> None:
-        self.program = program[:]
-        self.inputs = deque([phase])
-        self.pos = 0
-
-    def _get_value(self, pos: int, mode: int)-> int:
-        if mode == 0 :
-            # pointer mode
-            return self.program[self.program[pos]]
-        elif mode == 1:
-            # immediate mode
-            return self.program[pos]
-        else:
-            raise ValueError(f"unknown mode: {mode}")
-
-    def __call__(self, input_value: int) -> int:
-        self.inputs.append(input_value)
-        while True:
-            inst = parse_instructions2(self.pos, self.program)
-            opcode = inst.parameters.opcode
-            params = inst.parameters
-            logging.debug(f"pos: {self.pos}, opcode {opcode}, params: {params}")
-            if opcode == Opcode.PROGRAM_HALT: # stop 
-                return EndProgram
-            # params mode support immediate == 1 or position == 0  
-            elif opcode.parameter_support():
-                num1 = self._get_value(self.pos + 1, params.mod1)
-                num2 = self._get_value(self.pos + 2, params.mod2)                
-                if opcode == Opcode.ADD: #add
-                    self.program[inst.val3] = num1 + num2 #write to always in position
-                    self.pos += 4
-                elif opcode == Opcode.MULTIPLY: #mul
-                    self.program[inst.val3] = num1 * num2
-                    self.pos += 4
-                elif opcode == Opcode.JUMP_IF_TRUE: # pointer jump if true 
-                    self.pos = num2 if num1 else self.pos + 3
-                elif opcode == Opcode.JUMP_IF_FALSE: # pointer jump if False
-                    self.pos = num2 if not num1 else self.pos + 3
-                elif opcode == Opcode.LESS_THAN: # less than
-                    self.program[inst.val3] = 1 if num1 < num2 else 0
-                    self.pos += 4
-                elif opcode == Opcode.EQUALS: # equals
-                    self.program[inst.val3] = 1 if num1 == num2 else 0
-                    self.pos += 4
-                else:
-                    raise ValueError(f'unknown opcode{opcode} for param support at {self.pos}')
-            elif opcode == Opcode.STORE_INPUT:
-                curr_input = self.inputs.popleft()
-                self.program[inst.val1] = curr_input  # systems ID
-                self.pos += 2
-            elif opcode == Opcode.SEND_TO_OUTPUT:
-                # Get output from location
-                output = self._get_value(self.pos + 1, params.mod1)
-                self.pos += 2
-                return output
-            else:
-                raise ValueError(f'unknown opcode{opcode} for  at {self.pos}')
-                
+    Amplifiers wired in a ring on the network scheduler, each gets its phase
+    and the first one the 0 signal, the answer is the last amplifier's last output
+    """
+    amplifiers = {n: Intcode(program) for n in range(len(phases))}
+    for n, phase in enumerate(phases):
+        amplifiers[n].inputs.append(phase)
+    amplifiers[0].inputs.append(0)
+    result = Network(amplifiers, ring(list(amplifiers))).run()
+    if result.state != NetworkState.HALTED:
+        raise RuntimeError(f"amplifiers stopped in state {result.state}")
+    return result.outputs[len(phases) - 1][-1]
 
-def run_amplifiers(program: List[int], phases: List[int]) -> int:
-    amplifiers = deque([Amplifier(program, phase) for phase in phases])
-    output = 0
-
-    last_valid_output = None # could not implement try and except block
-    while amplifiers:
-        amplifier = amplifiers.popleft()
-        output = amplifier(output)
-        if output is EndProgram:
-            pass
-        else:
-            last_valid_output = output
-            amplifiers.append(amplifier)
-    return last_valid_output
-
-def run_amplifiers2(program: List[int], phases: List[int]) -> int:
-    amplifiers = deque([Amplifier(program, phase) for phase in phases])
-    output = 0
-
-    # try except capture not fully working 
-    while amplifiers:
-        amplifier = amplifiers.popleft()
-
-        try:
-            output = amplifier(output)
-            amplifiers.append(amplifier)
-        except EndProgram:
-            pass
-    return output
-
-    
 PROG1 = [3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,1001,28,-1,28,1005,28,6,99,0,0,5]
 PHASES1 = [9,8,7,6,5]
 assert run_amplifiers(PROG1, PHASES1) == 139629729
@@ -171,10 +45,112 @@ PROG1 = [3,52,1001,52,-5,52,3,53,1,52,56,54,1007,54,5,55,1005,55,26,1001,54,
 PHASES1 = [9,7,8,5,6]
 assert run_amplifiers(PROG1, PHASES1) == 18216
 
-def max_output(program: Program, phases_range:Tuple[int]= (5,10))-> int:
+class Sweep(NamedTuple):
+    signal: int # best signal so far
+    phases: Tuple[int, ...] # the phase settings giving it
+    evaluated: int # permutations run so far
+
+class StageCache:
+    """
+    First pass of one amplifier memoized per (phase, input signal): its state right after
+    its first output and that output, LRU bounded. Permutations sharing a prefix
+    (or reaching the same signal) start from the cached states instead of simulating again
+    """
+    def __init__(self, program: Program, maxsize: int = 4096):
+        self.root = Intcode(program)
+        self._start = self.root.snapshot()
+        self.stage = lru_cache(maxsize=maxsize)(self._stage)
+
+    def _stage(self, phase: int, signal: int) -> Tuple[Snapshot, int]:
+        machine = self.root.fork(self._start)
+        machine.inputs.extend([phase, signal])
+        if machine.run_until_output() != Status.OUTPUT:
+            raise RuntimeError(f"amplifier with phase {phase} gave no output for {signal}")
+        return machine.snapshot(), machine.outputs[-1]
+
+    def finish(self, snapshots: Tuple[Snapshot, ...], signal: int) -> int:
+        """Runs the feedback loop on from the amplifiers' states after the first pass"""
+        amplifiers = {n: self.root.fork(snapshot) for n, snapshot in enumerate(snapshots)}
+        amplifiers[0].inputs.append(signal)
+        result = Network(amplifiers, ring(list(amplifiers))).run()
+        if result.state != NetworkState.HALTED:
+            raise RuntimeError(f"amplifiers stopped in state {result.state}")
+        return result.outputs[len(snapshots) - 1][-1]
+
+def search_tree(cache: StageCache, phases: Tuple[int, ...], size: int, feedback: bool,
+                prefix: Tuple[int, ...] = (), snapshots: Tuple[Snapshot, ...] = (), signal: int = 0) -> Sweep:
+    """Best signal over the permutations extending prefix, each tree node simulated once"""
+    if len(prefix) == size:
+        return Sweep(cache.finish(snapshots, signal) if feedback else signal, prefix, 1)
+    best = Sweep(None, (), 0)
+    for phase in phases:
+        if phase not in prefix:
+            snapshot, output = cache.stage(phase, signal)
+            best = _merge(best, search_tree(cache, phases, size, feedback,
+                                            prefix + (phase,), snapshots + (snapshot,), output))
+    return best
+
+# set once per worker process by _init_worker, so tasks only carry a permutation prefix
+_WORKER_CACHE: Optional[StageCache] = None
+_WORKER_FEEDBACK = True
+
+def _init_worker(program: List[int], feedback: bool, cache_size: int = 4096) -> None:
+    global _WORKER_CACHE, _WORKER_FEEDBACK
+    _WORKER_CACHE, _WORKER_FEEDBACK = StageCache(program, cache_size), feedback
+
+def _sweep_shard(prefix: Tuple[int, ...], phases: Tuple[int, ...], size: int) -> Sweep:
+    """Best signal over every permutation starting with prefix"""
+    snapshots, signal = (), 0
+    for phase in prefix:
+        snapshot, signal = _WORKER_CACHE.stage(phase, signal)
+        snapshots += (snapshot,)
+    return search_tree(_WORKER_CACHE, phases, size, _WORKER_FEEDBACK, prefix, snapshots, signal)
+
+def shard_prefixes(phases: Tuple[int, ...], size: int, shards: int) -> List[Tuple[int, ...]]:
+    """Shortest permutation prefixes giving at least shards tasks"""
+    length, count = 0, 1
+    while count < shards and length < size:
+        count *= len(phases) - length
+        length += 1
+    return list(itertools.permutations(phases, length))
+
+def _merge(best: Sweep, shard: Sweep) -> Sweep:
+    if best.signal is None or (shard.signal is not None and shard.signal > best.signal):
+        best = best._replace(signal=shard.signal, phases=shard.phases)
+    return best._replace(evaluated=best.evaluated + shard.evaluated)
+
+def sweep(program: Program, phases: Iterable[int] = range(5, 10), size: Optional[int] = None,
+          feedback: bool = True, workers: Optional[int] = None, shards_per_worker: int = 4,
+          cache_size: int = 4096) -> Iterator[Sweep]:
+    """
+    Runs every permutation of size phases (all of them by default) on size amplifiers,
+    yielding the running maximum each time a shard of permutations sharing a prefix is done.
+    The program reaches each worker process once through the pool initializer,
+    which also gives the worker its StageCache of cache_size entries, workers=1 runs in process
+    """
+    phases = tuple(phases)
+    size = size or len(phases)
+    workers = workers or os.cpu_count()
+    prefixes = shard_prefixes(phases, size, workers * shards_per_worker)
+    best = Sweep(None, (), 0)
+    if workers == 1:
+        _init_worker(program, feedback, cache_size)
+        for prefix in prefixes:
+            best = _merge(best, _sweep_shard(prefix, phases, size))
+            yield best
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(program, feedback, cache_size)) as executor:
+        futures = [executor.submit(_sweep_shard, prefix, phases, size) for prefix in prefixes]
+        for future in as_completed(futures):
+            best = _merge(best, future.result())
+            yield best
+
+def max_output(program: Program, phases_range:Tuple[int]= (5,10), workers: Optional[int] = 1)-> int:
+    """Highest feedback loop signal, workers=None uses every core"""
     bottom, top = phases_range
-    return max(run_amplifiers(program, phases) for 
-            phases in itertools.permutations(range(bottom,top)))
+    *_, best = sweep(program, range(bottom, top), workers=workers)
+    return best.signal
 
 PROG1 = [3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,1001,28,-1,28,1005,28,6,99,0,0,5]
 assert max_output(PROG1) == 139629729
@@ -184,19 +160,20 @@ PROG1 = [3,52,1001,52,-5,52,3,53,1,52,56,54,1007,54,5,55,1005,55,26,1001,54,
 53,1001,56,-1,56,1005,56,6,99,0,0,0,0,10]
 assert max_output(PROG1) == 18216
 
-if __name__ == "__main__":
-    with open("day07_input.txt", 'r') as file:
-        program = problem_prep(file.read())
-        part2 = max_output(program = program)
-        print("max signal in feedback loop: part2", part2)
-
-
-
-
-
-
-
-
-
+# part 1 chain: the running maximum ends on the best signal and its phases
+PROG1 = [3,23,3,24,1002,24,10,24,1002,23,-1,23,101,5,23,23,1,24,23,23,4,23,99,0,0]
+*_, best = sweep(PROG1, range(5), feedback=False, workers=1)
+assert best == Sweep(54321, (0, 1, 2, 3, 4), 120)
+*_, best = sweep(PROG1, range(7), size=3, feedback=False, workers=1, shards_per_worker=10)
+assert best == Sweep(543, (0, 1, 2), 7 * 6 * 5)
 
+# the feedback example walked as a prefix tree: 325 tree nodes, repeated (phase, signal) pairs come from the cache
+cache = StageCache([3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,1001,28,-1,28,1005,28,6,99,0,0,5])
+assert search_tree(cache, (5, 6, 7, 8, 9), 5, feedback=True) == Sweep(139629729, (9, 8, 7, 6, 5), 120)
+info = cache.stage.cache_info()
+assert info.hits + info.misses == 5 + 20 + 60 + 120 + 120 and info.misses < 325
 
+if __name__ == "__main__":
+    program = load_program("day07_input.txt")
+    part2 = max_output(program = program, workers=None)
+    print("max signal in feedback loop: part2", part2)
@@ -2,15 +2,17 @@
 My second attempt using OOP for day09
 """
 import intcode
+from intcode_image import load_program
 from typing import NamedTuple, List
 
 
 def run_sensor(program: List[int], input : List[int] = [1]) -> List[int]:
     sensor = intcode.Intcode(program)
-    while True:
-        sensor(input = input) 
-        if intcode.EndProgram:
-            return sensor.outputs
+    sensor.inputs.extend(input)
+    status = sensor.run()
+    if status != intcode.Status.HALTED:
+        raise RuntimeError(f"sensor stopped with {status}")
+    return sensor.outputs
 
 TEST1 = [109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99]
 assert run_sensor(TEST1) == TEST1
@@ -20,9 +22,8 @@ TEST1 = [104,1125899906842624,99]
 assert run_sensor(TEST1)[0] == TEST1[1]
 
 if __name__ == "__main__":
-    with open("day09_puzzle.txt", 'r') as file:
-        program = intcode.problem_prep(file.read())
-        part1 = run_sensor(program=program, input=[1])
-        part2 = run_sensor(program=program, input=[2])
-        print('part 1 test mode',part1)
-        print('part 2 sensor boost mode',part2)
\ No newline at end of file
+    program = load_program("day09_puzzle.txt")
+    part1 = run_sensor(program=program, input=[1])
+    part2 = run_sensor(program=program, input=[2])
+    print('part 1 test mode',part1)
+    print('part 2 sensor boost mode',part2)
\ No newline at end of file
@@ -16,178 +16,161 @@ https://adventofcode.com/2019/day/11
 - The robot will continue running for a while like this and halt when it is finished drawing. Do not restart the Intcode computer inside the robot during this process.
 """
 
-from typing import List, NamedTuple, Tuple, Union
-from enum import Enum
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 from collections import deque
-import copy
+from intcode import Intcode
+from intcode_image import load_program
+from renderer import Renderer
 
 IJ = Tuple[int,int]
-Grid = List[List[int]]
+
+CHUNK_BITS = 6
+CHUNK = 1 << CHUNK_BITS # panels per side of a chunk
+MASK = CHUNK - 1
+PALETTE = " \u2588" # black, white
 
 class TrackRobot(NamedTuple):
     loc: IJ # (i, j) 
     facing: str #  ('UP','DOWN','LEFT','RIGHT')
 
-class Opcode(Enum): 
-    ADD = 1
-    MULTIPLY = 2
-    STORE_INPUT = 3
-    SEND_TO_OUTPUT = 4
-    JUMP_IF_TRUE = 5 
-    JUMP_IF_FALSE = 6 
-    LESS_THAN = 7 
-    EQUALS = 8 
-    ADJUST_RELATIVE_BASE = 9 
-    PROGRAM_HALT = 99
-
-class Modes(NamedTuple):
-    opcode: int
-    mode1: int
-    mode2: int
-    mode3: int 
-
-def parse_opcode(input: int) -> Modes:
-    padded = f"{input:05}"
-    return Modes(opcode= Opcode(int(padded[-2:])), 
-                      mode1= int(padded[-3]), 
-                      mode2=int(padded[-4]), 
-                      mode3=int(padded[-5]))  
+class Chunk:
+    """CHUNK x CHUNK panels, one bit each for painted and for white"""
+    def __init__(self):
+        self.painted = bytearray(CHUNK * CHUNK // 8)
+        self.white = bytearray(CHUNK * CHUNK // 8)
 
-def problem_prep(problem_input: str) -> List[int]:
-    inputs = [int(num) for num in problem_input.strip().split(",")]
-    return inputs
-
-def handle_mode(program: List[int], pos: int, mode: int, relative_base: int)-> int:
-        immediate_parameter = program[pos]
-        if mode == 0 :
-            # position mode
-            return program[immediate_parameter]
-        elif mode == 1:
-            # immediate mode
-            return  immediate_parameter
-        elif mode == 2:
-            # relative mode
-            return program[immediate_parameter + relative_base] 
-        else:
-            raise ValueError(f"unknown mode: {mode} at pos {pos}")
-
-def _loc(program: List[int], pos: int, mode: int, relative_base: int)-> int:
+class Hull:
     """
-    handles the writting instruction location , either in position or relative mode. 
-    We need to know the loc where the value will be written to in the program
+    Unbounded hull, x = col and y = row (going up). A chunk is allocated the first time a panel in it
+    is painted, so memory follows the painted area wherever the robot wanders; the bounds of the
+    painted panels are kept as they are painted, render only draws the box around the white ones
     """
-    immediate_parameter = program[pos]
-    if mode == 0:
-        # position mode
-        return immediate_parameter
-    elif mode == 2:
-        # relative mode
-        return immediate_parameter + relative_base
-
-
-
-def run_intcode(program: List[int], part2: bool = True, offset :int = 20) -> Union[int, Grid]:
+    def __init__(self):
+        self.chunks: Dict[Tuple[int, int], Chunk] = {}
+        self.painted = 0 # panels painted at least once
+        self.bounds: Optional[Tuple[int, int, int, int]] = None # left, bottom, right, top
+        self._key: Optional[Tuple[int, int]] = None # last chunk used, the robot stays in one most steps
+        self._chunk: Optional[Chunk] = None
+
+    def __len__(self) -> int:
+        return self.painted
+
+    def _find(self, x: int, y: int, create: bool) -> Optional[Chunk]:
+        key = (x >> CHUNK_BITS, y >> CHUNK_BITS)
+        if key == self._key:
+            return self._chunk
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if not create:
+                return None
+            chunk = self.chunks[key] = Chunk()
+        self._key, self._chunk = key, chunk
+        return chunk
+
+    def colour(self, x: int, y: int) -> int:
+        chunk = self._find(x, y, create=False)
+        if chunk is None:
+            return 0 # never painted, black
+        i = (y & MASK) << CHUNK_BITS | (x & MASK)
+        return chunk.white[i >> 3] >> (i & 7) & 1
+
+    def paint(self, x: int, y: int, colour: int) -> None:
+        chunk = self._find(x, y, create=True)
+        i = (y & MASK) << CHUNK_BITS | (x & MASK)
+        byte, bit = i >> 3, 1 << (i & 7)
+        if not chunk.painted[byte] & bit:
+            chunk.painted[byte] |= bit
+            self.painted += 1
+            if self.bounds is None:
+                self.bounds = (x, y, x, y)
+            else:
+                left, bottom, right, top = self.bounds
+                if not (left <= x <= right and bottom <= y <= top):
+                    self.bounds = (min(left, x), min(bottom, y), max(right, x), max(top, y))
+        if colour:
+            chunk.white[byte] |= bit
+        else:
+            chunk.white[byte] &= ~bit
+
+    def whites(self) -> Iterator[IJ]:
+        """(x, y) of the white panels, a chunk at a time"""
+        for (cx, cy), chunk in self.chunks.items():
+            for byte, bits in enumerate(chunk.white):
+                while bits:
+                    low = bits & -bits
+                    i = byte << 3 | low.bit_length() - 1
+                    yield (cx << CHUNK_BITS | i & MASK, cy << CHUNK_BITS | i >> CHUNK_BITS)
+                    bits ^= low
+
+    def draw(self, palette: str = PALETTE) -> Renderer:
+        """
+        Screen cropped to the white panels, largest y on top:
+        black panels painted far from them don't make it any bigger
+        """
+        whites = list(self.whites())
+        xs = [x for x, _ in whites] or [0]
+        ys = [y for _, y in whites] or [0]
+        screen = Renderer(max(xs) - min(xs) + 1, max(ys) - min(ys) + 1, palette,
+                          origin=(min(xs), min(ys)), flip=True)
+        for x, y in whites:
+            screen.set(x, y, 1)
+        return screen
+
+    def render(self) -> str:
+        return self.draw().render() if any(any(chunk.white) for chunk in self.chunks.values()) else ""
+
+def run_intcode(program: List[int], part2: bool = True,
+                renderer: Optional[Renderer] = None) -> Union[int, Hull]:
     """
-    Programs takes an input, 9 + 1 opcodes are valid
-    Parameter mode suport is available for 6 opcodes
-    pointer(i) is incremented by the number of values in the instruction
+    Drives the robot with the shared Intcode engine as its brain:
+    the camera answers input instructions, every pair of outputs paints and moves the robot.
+    Panels painted are also set on renderer (x = col, y = row) when given, to watch the robot live
     """
-    program = program[:]
-    initial_loc = (0, 0)
-    robot = TrackRobot(loc = initial_loc, facing='UP') # start the robot
-    grid = create_grid() # 80 x 80
-    grid_loc = {} # track painted locs
+    robot = TrackRobot(loc = (0, 0), facing='UP') # start the robot
+    hull = Hull()
     
     if part2:
-        row, col = initial_loc
-        grid_loc[initial_loc] = 1 # part 2 requirement
-        grid[row + offset][col + offset] = 1   # offset of 20 , (0,0) is (20,20) on grid      
-    
-    for _ in range(10000):
-        program.append(0)  # add program large memory, lazy solution
+        hull.paint(0, 0, 1) # part 2 requirement
+        if renderer is not None:
+            renderer.set(0, 0, 1)
 
     outputs = deque([])
-    pos = relative_base =  0
 
-    while True:
-        modes = parse_opcode(program[pos])
-        opcode = modes.opcode
-        if opcode == Opcode.PROGRAM_HALT: 
-            break
-        elif opcode == Opcode.ADD:
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            num2 = handle_mode(program, pos + 2, modes.mode2, relative_base)
-            loc = _loc(program, pos + 3, modes.mode3, relative_base)
-            program[loc] = num1 + num2        
-            pos += 4
-        elif opcode == Opcode.MULTIPLY: 
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            num2 = handle_mode(program, pos + 2, modes.mode2, relative_base)
-            loc = _loc(program, pos + 3, modes.mode3, relative_base)
-            program[loc] = num1 * num2
-            pos += 4
-        elif opcode == Opcode.JUMP_IF_TRUE:
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            num2 = handle_mode(program, pos + 2, modes.mode2, relative_base)
-            pos = num2 if num1 else pos + 3
-        elif opcode == Opcode.JUMP_IF_FALSE: 
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            num2 = handle_mode(program, pos + 2, modes.mode2, relative_base) 
-            pos = num2 if not num1 else pos + 3
-        elif opcode == Opcode.LESS_THAN: 
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            num2 = handle_mode(program, pos + 2, modes.mode2, relative_base)
-            loc = _loc(program, pos + 3, modes.mode3, relative_base)
-            program[loc] = 1 if num1 < num2 else 0
-            pos += 4
-        elif opcode == Opcode.EQUALS: 
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            num2 = handle_mode(program, pos + 2, modes.mode2, relative_base)
-            loc = _loc(program, pos + 3, modes.mode3, relative_base)
-            program[loc] = 1 if num1 == num2 else 0
-            pos += 4
-        elif opcode == Opcode.STORE_INPUT: 
-            loc = _loc(program, pos + 1, modes.mode1, relative_base)
-            input =  grid_loc.get(robot.loc, 0) # if loc not in grid assumed black
-            program[loc] = input
-            pos += 2
-        elif opcode == Opcode.SEND_TO_OUTPUT:
-            output = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            outputs.append(output)
-            if len(outputs) == 2:
-                paint = outputs.popleft() # first instruction
-                turn = outputs.popleft()
-                grid_loc[robot.loc] = 1 if paint == 1 else 0 # paint the grid_loc[loc] white else paint visited loc black
-                if part2:
-                    row, col = robot.loc
-                    if paint == 1:
-                        grid[row + offset][col + offset] = 1 
-                    else:
-                        grid[row + offset][col + offset] = 0
-                now_facing = turn_robot(turn=turn, facing=robot.facing)
-                new_loc = move_robot(loc=robot.loc, facing=now_facing)
-                robot = TrackRobot(loc=new_loc, facing=now_facing)           
-            pos += 2
-        elif opcode == Opcode.ADJUST_RELATIVE_BASE:
-            num1 = handle_mode(program, pos + 1, modes.mode1, relative_base)
-            relative_base += num1
-            pos += 2
-        else:
-            raise RuntimeError(f"invalid opcode {opcode} at position {pos}")
-    return grid if part2 else len(grid_loc)
+    def camera() -> int:
+        row, col = robot.loc
+        return hull.colour(col, row) # never painted is black
+
+    def paint_and_move(output: int) -> None:
+        nonlocal robot
+        outputs.append(output)
+        if len(outputs) == 2:
+            paint = outputs.popleft() # first instruction
+            turn = outputs.popleft()
+            row, col = robot.loc
+            hull.paint(col, row, paint)
+            if renderer is not None:
+                renderer.set(col, row, paint)
+            now_facing = turn_robot(turn=turn, facing=robot.facing)
+            new_loc = move_robot(loc=robot.loc, facing=now_facing)
+            robot = TrackRobot(loc=new_loc, facing=now_facing)           
+
+    brain = Intcode(program, input_provider=camera, output_sink=paint_and_move)
+    brain.run()
+    return hull if part2 else len(hull)
+
+CLOCKWISE = {'UP': 'RIGHT','RIGHT': 'DOWN', 'DOWN': 'LEFT', 
+            'LEFT':'UP'}
+COUNTER_CLOCKWISE = {'UP': 'LEFT', 'LEFT': 'DOWN', 'DOWN': 'RIGHT',
+                    'RIGHT': 'UP'}
 
 def turn_robot(turn: int, facing: str) -> str:
     """
     Given instruction turn, rotate the robot 
     """
-    clockwise = {'UP': 'RIGHT','RIGHT': 'DOWN', 'DOWN': 'LEFT', 
-                'LEFT':'UP'}
-    counter_clockwise = {'UP': 'LEFT', 'LEFT': 'DOWN', 'DOWN': 'RIGHT',
-                        'RIGHT': 'UP'}
     if turn == 1: 
-        return clockwise[facing]
+        return CLOCKWISE[facing]
     elif turn == 0:
-        return counter_clockwise[facing]
+        return COUNTER_CLOCKWISE[facing]
     else:
         raise ValueError(f'unknown instruction{turn}')
 
@@ -225,40 +208,27 @@ assert move_robot((-3,-4), 'DOWN') == (-4, -4)
 
 # PART 2 
 
-def create_grid(rows: int=80, columns: int=80) -> Grid:
-    """
-    80 x 80 matrix by default 
-    eyeballed for registration identifier printing
-    set to black (0)"""
-    return [[0
-        for _ in range(rows)]
-        for _ in range(columns)
-        ]
-
-def get_image(grid: Grid, columns: int = 80, rows: int = 80)-> List[List[str]]:
-    hull = list(reversed(copy.deepcopy(grid))) # image is upside down 
-    for i in range(rows):
-        for j in range(columns):
-            color = hull[i][j]
-            if color == 0 :
-                hull[i][j] = " "  # easier to read
-            else:
-                hull[i][j] = "\u2588"
-    return hull
-
-def print_image(grid: Grid, columns: int = 80, rows: int = 80)-> str:
-    image_hull = get_image(grid, columns, rows)
-    image = []
-    for row in image_hull:
-        image.append("".join(row))
-    return "\n".join(image)
+def print_image(hull: Hull) -> str:
+    return hull.render()
+
+# panels on either side of 0 fall in different chunks, far away ones in their own
+_hull = Hull()
+for _x, _y, _colour in [(0, 0, 1), (-1, 0, 1), (2, -1, 1), (-1, 0, 0), (-5000, 70_000, 0)]:
+    _hull.paint(_x, _y, _colour)
+assert len(_hull) == 4 and len(_hull.chunks) == 4 and _hull.bounds == (-5000, -1, 2, 70_000)
+assert _hull.colour(2, -1) == _hull.colour(0, 0) == 1 and _hull.colour(-1, 0) == _hull.colour(9, 9) == 0
+assert sorted(_hull.whites()) == [(0, 0), (2, -1)]
+_screen = _hull.draw() # the black panel at (-5000, 70_000) is left out
+assert (_screen.left, _screen.bottom, _screen.width, _screen.height) == (0, -1, 3, 2)
+_hull = Hull()
+for _x, _y in [(0, 0), (2, -1), (1, -1)]:
+    _hull.paint(_x, _y, 1 if _x != 1 else 0)
+assert print_image(_hull) == "\u2588  \n  \u2588" # only the painted bounds, row 0 on top
 
 if __name__ == "__main__":
-    with open('day11_puzzle.txt', 'r') as file:
-        program = problem_prep(file.read())
-        #print(program, len(program))
-        part1 = run_intcode(program=program, part2=False)
-        grid = run_intcode(program=program, part2=True)
-        print('total unique loc painted', part1)
-        print('registration identifier part2',print_image(grid)[4500:5500]) # crop image
-
+    program = load_program('day11_puzzle.txt')
+    part1 = run_intcode(program=program, part2=False)
+    hull = run_intcode(program=program, part2=True)
+    print('total unique loc painted', part1)
+    print('registration identifier part2')
+    print(print_image(hull))
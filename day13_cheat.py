@@ -0,0 +1,139 @@
+"""
+Breakout without playing it: day13 part 2 answered from the program's memory
+
+The cabinet keeps its screen as a width x height grid of tile ids in memory and the points of every
+cell in a table of the same size right after it; breaking a block adds the points the score routine
+looks up for its (x, y). analyse finds these with the disassembler:
+    - the tile lookup computes grid + y * width + x into an operand, MULTIPLY by #width then ADD #grid
+    - the score routine adds #table (= grid + width * height) to the index it computed
+The final score is the sum of the points of the blocks on the starting screen, the score routine
+is run in a sandbox once per block. The other cheat walls the paddle row in, the game then plays
+itself out with the joystick left alone.
+"""
+
+from typing import List, NamedTuple, Optional, Tuple
+from intcode import Intcode, Opcode, Status
+from intcode_disasm import disassemble
+from day13_breakout2 import TilesID
+from day13_headless import play
+from intcode_image import load_program
+
+class Layout(NamedTuple):
+    grid: int # address of the tile at (0, 0), rows of width tiles
+    width: int
+    height: int
+    table: int # address of the points table, width * height cells
+    score_routine: int # entry of the routine giving the points cell of (x, y)
+
+def analyse(program: List[int]) -> Layout:
+    """Where the screen and the points are, raises ValueError when the program doesn't look like the cabinet"""
+    result = disassemble(program)
+    instructions = [result.instructions[address] for address in sorted(result.instructions)]
+    layout = None
+    for first, second, third in zip(instructions, instructions[1:], instructions[2:]):
+        # cell = y * width; cell += x; cell += grid, all in the operand of the next instruction
+        if (first.opcode == Opcode.MULTIPLY and second.opcode == third.opcode == Opcode.ADD
+                and 1 in first.modes[:2] and third.modes[0] == 1 and first.modes[2] == 0
+                and first.params[2] == second.params[2] == third.params[2]):
+            width = first.params[first.modes.index(1)]
+            grid = third.params[0]
+            layout = (grid, width)
+            break
+    if layout is None:
+        raise ValueError("no tile lookup found")
+    grid, width = layout
+    for decoded in instructions:
+        if decoded.opcode != Opcode.ADD or 1 not in decoded.modes[:2]:
+            continue
+        table = decoded.params[decoded.modes.index(1)]
+        height, rest = divmod(table - grid, width)
+        if table > grid and not rest and table + width * height <= len(program):
+            # the routine starts at the closest call target before the table lookup
+            entries = [block for block in result.blocks if block <= decoded.address
+                       and result.instructions[block].opcode == Opcode.ADJUST_RELATIVE_BASE]
+            if entries:
+                return Layout(grid, width, height, table, max(entries))
+    raise ValueError("no points table found")
+
+def tiles(program: List[int], layout: Layout) -> List[Tuple[int, int, TilesID]]:
+    return [(x, y, TilesID(program[layout.grid + y * layout.width + x]))
+            for y in range(layout.height) for x in range(layout.width)]
+
+def points(program: List[int], layout: Layout, x: int, y: int) -> int:
+    """
+    Runs the score routine on (x, y) like the game calls it: return address at the relative base,
+    arguments after it, the result (the points cell) back in the first argument
+    """
+    base = len(program) + 16 # free memory, the return address points at a halt placed below it
+    sandbox = Intcode(program, engine='interpreter')
+    sandbox.poke(base - 1, 99)
+    for offset, value in enumerate((base - 1, x, y)):
+        sandbox.poke(base + offset, value)
+    sandbox.relative_base, sandbox.pos = base, layout.score_routine
+    if sandbox.run(budget=100_000) != Status.HALTED or sandbox.pos != base - 1:
+        raise ValueError(f"the score routine didn't return for {(x, y)}")
+    cell = sandbox.program[base + 1]
+    if not layout.table <= cell < layout.table + layout.width * layout.height:
+        raise ValueError(f"the score routine gave {cell} for {(x, y)}, outside the table")
+    return program[cell]
+
+def final_score(program: List[int], layout: Optional[Layout] = None) -> int:
+    """Score once every block on the starting screen is broken"""
+    layout = layout or analyse(program)
+    return sum(points(program, layout, x, y) for x, y, tile in tiles(program, layout) if tile == TilesID.BLOCK)
+
+def wall_paddle_row(program: List[int], layout: Optional[Layout] = None) -> List[int]:
+    """The program with the paddle's row made of walls, the ball can't get past it"""
+    layout = layout or analyse(program)
+    patched = list(program)
+    rows = {y for x, y, tile in tiles(program, layout) if tile == TilesID.PADDLE}
+    if len(rows) != 1:
+        raise ValueError(f"expected one paddle row, found {sorted(rows)}")
+    row = layout.grid + rows.pop() * layout.width
+    for x in range(1, layout.width - 1):
+        patched[row + x] = TilesID.WALL.value
+    return patched
+
+def play_walled(program: List[int]) -> int:
+    """Plays the walled game to the end, the joystick always at rest; returns the last score shown"""
+    scores = []
+    outputs = []
+    def screen(value: int) -> None:
+        outputs.append(value)
+        if len(outputs) == 3:
+            if outputs[:2] == [-1, 0]:
+                scores.append(outputs[2])
+            outputs.clear()
+    machine = Intcode(wall_paddle_row(program), input_provider=lambda: 0, output_sink=screen)
+    machine.poke(0, 2)
+    if machine.run() != Status.HALTED:
+        raise RuntimeError("the walled game didn't end")
+    return scores[-1]
+
+# a cabinet in miniature: a 3 x 2 screen, its points right after it and the routine scoring (x, y)
+_CABINET = [1002, 34, 3, 35, 1, 33, 35, 35, 101, 36, 35, 35, 1105, 1, 16, 99, # tile lookup, call the score routine
+            109, 0, 21202, 2, 3, 2, 22201, 1, 2, 1, 22101, 42, 1, 1, 2105, 1, 0, # (x, y) -> 42 + y * 3 + x, return
+            0, 0, 0, # x, y, tile cell
+            2, 2, 1, 1, 3, 1, # two blocks, the paddle under them
+            5, 7, 0, 0, 0, 0]
+_layout = analyse(_CABINET)
+assert _layout == Layout(grid=36, width=3, height=2, table=42, score_routine=16)
+assert [points(_CABINET, _layout, x, 0) for x in range(3)] == [5, 7, 0] and final_score(_CABINET, _layout) == 12
+assert wall_paddle_row(_CABINET, _layout)[36:42] == [2, 2, 1, 1, 1, 1]
+
+if __name__ == "__main__":
+    import time
+    from pathlib import Path
+    # the puzzle input three ways: read from memory, walled in, and the full game with the paddle
+    program = load_program(Path(__file__).resolve().parent / "day13_puzzle_input.txt")
+    layout = analyse(program)
+    assert layout == Layout(grid=639, width=37, height=24, table=1527, score_routine=601)
+    assert final_score(program, layout) == play_walled(program) == play(program).score == 14538
+    timings = []
+    for name, solve in (("full game, predictive paddle", lambda: play(program).score),
+                        ("paddle row walled in", lambda: play_walled(program)),
+                        ("points read from memory", lambda: final_score(program))):
+        start = time.perf_counter()
+        score = solve()
+        timings.append(time.perf_counter() - start)
+        print(f"{name:>30}: {score} in {timings[-1] * 1000:8.1f} ms, {timings[0] / timings[-1]:7.1f}x")
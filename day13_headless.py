@@ -0,0 +1,100 @@
+"""
+Headless Breakout: the game from day13 part 2 played without a screen by a paddle that
+predicts where the ball comes down instead of following it, as fast as the VM goes.
+
+The ball moves one cell a frame diagonally, so from two frames its velocity gives the column where
+it reaches the row above the paddle, folding the path back at the side walls. Blocks can still
+deflect it, the prediction is redone on the next frame that drew something.
+Frames where no tile changed since the last input keep the previous joystick position.
+
+python day13_headless.py                      one game with its report
+python day13_headless.py --benchmark 20 --engine jit   full games back to back, VM throughput
+"""
+
+import argparse
+import time
+from typing import List, NamedTuple, Optional
+from day13_breakout2 import Breakout, TileState, TilesID, XY
+from intcode import ENGINES, Status
+from intcode_image import load_program
+
+class GameReport(NamedTuple):
+    score: int
+    won: bool # every block broken
+    frames: int # joystick inputs the game asked for
+    skipped: int # frames nothing was drawn in, answered without predicting
+    instructions: int
+    seconds: float
+
+    @property
+    def instructions_per_second(self) -> float:
+        return self.instructions / self.seconds if self.seconds else 0.0
+
+def landing_x(x: int, vx: int, steps: int, left: int, right: int) -> int:
+    """Column after steps diagonal moves from x, bouncing between the columns left and right"""
+    period = 2 * (right - left)
+    if period == 0:
+        return left
+    offset = (x - left + vx * steps) % period
+    return left + (offset if offset <= right - left else period - offset)
+
+class PredictiveBreakout(Breakout):
+    def __init__(self, program: List[int], engine: Optional[str] = None):
+        super().__init__(program, engine)
+        self.frames = self.skipped = 0
+        self.previous_ball: Optional[XY] = None
+        self.bounds: Optional[tuple] = None # columns the ball moves between
+        self._move = 0
+        self._drawn = True
+
+    def handle_tiles_loc(self, outputs: List[int]) -> None:
+        super().handle_tiles_loc(outputs)
+        self._drawn = True
+
+    def joystick_movement(self, tiles: TileState) -> int:
+        self.frames += 1
+        if not self._drawn:
+            self.skipped += 1
+            return self._move
+        self._drawn = False
+        if self.bounds is None: # once, the walls don't move
+            walls = [xy.x for xy, tile in tiles.tiles.items() if tile == TilesID.WALL]
+            self.bounds = (min(walls) + 1, max(walls) - 1)
+        ball, paddle = tiles.ball, tiles.paddle
+        previous, self.previous_ball = self.previous_ball, ball
+        target = ball.x
+        if previous is not None and ball.y - previous.y > 0 and ball.y < paddle.y:
+            target = landing_x(ball.x, ball.x - previous.x, paddle.y - 1 - ball.y, *self.bounds)
+        self._move = (target > paddle.x) - (target < paddle.x)
+        return self._move
+
+def play(program: List[int], engine: Optional[str] = None) -> GameReport:
+    """Plays one free game to the end"""
+    game = PredictiveBreakout(program, engine)
+    game.machine.poke(0, 2)
+    start = time.perf_counter()
+    status = game.machine.run()
+    seconds = time.perf_counter() - start
+    if status != Status.HALTED:
+        raise RuntimeError(f"the game stopped with {status}")
+    return GameReport(score=game.score, won=game.tiles.blocks == 0, frames=game.frames, skipped=game.skipped,
+                      instructions=game.machine.instructions, seconds=seconds)
+
+assert landing_x(5, 1, 3, 1, 10) == 8 and landing_x(9, 1, 3, 1, 10) == 8 and landing_x(2, -1, 4, 1, 10) == 4
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--benchmark', type=int, metavar='GAMES', help="play this many full games and report throughput")
+    parser.add_argument('--engine', choices=ENGINES)
+    args = parser.parse_args()
+    program = load_program("day13_puzzle_input.txt")
+    reports = [play(program, args.engine) for _ in range(args.benchmark or 1)]
+    report = reports[0]
+    print(f"score {report.score} ({'won' if report.won else 'lost'}), {report.frames} frames "
+          f"({report.skipped} skipped), {report.instructions} instructions in {report.seconds:.3f} s, "
+          f"{report.instructions_per_second / 1e6:.2f} M instr/s")
+    if args.benchmark:
+        rates = sorted(r.instructions_per_second for r in reports)
+        total = sum(r.seconds for r in reports)
+        print(f"{len(reports)} games in {total:.2f} s: {len(reports) / total:.2f} games/s, "
+              f"M instr/s best {rates[-1] / 1e6:.2f} median {rates[len(rates) // 2] / 1e6:.2f} worst {rates[0] / 1e6:.2f}")
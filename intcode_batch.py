@@ -0,0 +1,221 @@
+"""
+Vectorized batch execution of one Intcode program over many independent inputs
+
+Every lane is one machine, memories are rows of a 2-D int64 array and all lanes step in lockstep.
+Lanes whose program counters diverged are grouped by (pc, instruction word) and each group runs
+as one NumPy operation, halted or blocked lanes are masked out.
+int64 can overflow (day09 multiplies 16 digit numbers), a lane that would is rerun
+on the Python int engine and reported in overflowed. Lanes given inputs or patches past int64
+go straight to the Python engine, all of them when the program itself holds such a value.
+"""
+
+from typing import NamedTuple, List, Dict, Optional, Sequence, Iterable
+import numpy as np
+from intcode import Intcode, DECODE_TABLE, Opcode, Status
+
+INT64_SAFE = 2 ** 62 # products of operands below this magnitude can't overflow int64
+INT64 = np.iinfo(np.int64)
+
+class BatchResult(NamedTuple):
+    outputs: List[List[int]]
+    status: List[Status]
+    memory: np.ndarray # final memory per lane, rows of overflowed lanes are stale
+    overflowed: List[int] # lanes rerun on Python ints
+    machines: Dict[int, Intcode] # the Python machines that reran them
+    steps: int # lockstep steps taken
+
+    def value(self, lane: int, address: int) -> int:
+        if lane in self.machines:
+            return self.machines[lane].program[address]
+        return int(self.memory[lane, address]) if address < self.memory.shape[1] else 0
+
+class _Fallback(Exception): pass
+
+def _fits(values: Iterable[int]) -> bool:
+    return all(INT64.min <= value <= INT64.max for value in values)
+
+def run_batch(program: List[int], inputs: Sequence[Sequence[int]] = (),
+              patches: Sequence[Dict[int, int]] = (), max_steps: int = 10_000_000) -> BatchResult:
+    """
+    Runs program on max(len(inputs), len(patches)) lanes,
+    lane n reads inputs[n] and starts with memory patched by patches[n] ({address: value}).
+    Every lane runs at most max_steps instructions, lanes still running after that are SUSPENDED
+    (their memory and outputs are as far as they got)
+    """
+    lanes = max(len(inputs), len(patches))
+    inputs = [list(lane_inputs) for lane_inputs in inputs] + [[]] * (lanes - len(inputs))
+    patches = list(patches) + [{}] * (lanes - len(patches))
+    # values past int64 can't go in the arrays, those lanes run on Python ints from the start
+    if _fits(program):
+        big = {lane for lane in range(lanes) if not _fits(inputs[lane]) or not _fits(patches[lane].values())}
+    else:
+        big = set(range(lanes))
+    size = max([len(program)] + [address + 1 for patch in patches for address in patch])
+    memory = np.zeros((lanes, size), dtype=np.int64)
+    if len(big) < lanes:
+        memory[:, :len(program)] = program
+    for lane, patch in enumerate(patches):
+        if lane not in big:
+            for address, value in patch.items():
+                memory[lane, address] = value
+    width = max([len(lane_inputs) for lane_inputs in inputs] + [1])
+    input_table = np.zeros((lanes, width), dtype=np.int64)
+    input_counts = np.array([len(lane_inputs) for lane_inputs in inputs], dtype=np.int64)
+    for lane, lane_inputs in enumerate(inputs):
+        if lane not in big:
+            input_table[lane, :len(lane_inputs)] = lane_inputs
+    input_read = np.zeros(lanes, dtype=np.int64)
+    pc = np.zeros(lanes, dtype=np.int64)
+    rb = np.zeros(lanes, dtype=np.int64)
+    active = np.ones(lanes, dtype=bool)
+    active[sorted(big)] = False
+    status: List[Optional[Status]] = [None] * lanes
+    outputs: List[List[int]] = [[] for _ in range(lanes)]
+    overflowed: List[int] = sorted(big)
+
+    def grow(needed: int) -> None:
+        nonlocal memory
+        if needed > memory.shape[1]:
+            extra = max(needed, 2 * memory.shape[1]) - memory.shape[1]
+            memory = np.concatenate([memory, np.zeros((lanes, extra), dtype=np.int64)], axis=1)
+
+    def read(idx: np.ndarray, address: np.ndarray) -> np.ndarray:
+        if (address < 0).any():
+            raise _Fallback
+        inside = address < memory.shape[1]
+        if inside.all():
+            return memory[idx, address]
+        return np.where(inside, memory[idx, np.where(inside, address, 0)], 0) # reads past the end are 0
+
+    def parameter(idx: np.ndarray, at: np.ndarray, mode: int) -> np.ndarray:
+        raw = read(idx, at)
+        if mode == 1:
+            return raw
+        return read(idx, raw if mode == 0 else raw + rb[idx])
+
+    def write(idx: np.ndarray, at: np.ndarray, mode: int, values: np.ndarray) -> None:
+        if not len(idx):
+            return
+        address = read(idx, at)
+        if mode == 2:
+            address = address + rb[idx]
+        elif mode != 0:
+            raise _Fallback
+        if (address < 0).any():
+            raise _Fallback
+        grow(int(address.max()) + 1)
+        memory[idx, address] = values
+
+    def fallback(idx: np.ndarray) -> None:
+        for lane in idx.tolist():
+            active[lane] = False
+            overflowed.append(lane)
+
+    steps = 0
+    while active.any() and steps < max_steps:
+        steps += 1
+        running = np.flatnonzero(active)
+        words = read(running, pc[running])
+        keys = np.stack([pc[running], words])
+        for key in np.unique(keys, axis=1).T:
+            group_pc, word = int(key[0]), int(key[1])
+            idx = running[(keys[0] == group_pc) & (keys[1] == word)]
+            inst = DECODE_TABLE.get(word)
+            if inst is None:
+                fallback(idx) # let the Python engine raise the error for these lanes
+                continue
+            opcode, modes = inst.opcode, inst.modes
+            at = np.full(len(idx), group_pc, dtype=np.int64)
+            try:
+                if opcode == Opcode.PROGRAM_HALT:
+                    active[idx] = False
+                    for lane in idx.tolist():
+                        status[lane] = Status.HALTED
+                    continue
+                elif opcode in (Opcode.ADD, Opcode.MULTIPLY, Opcode.LESS_THAN, Opcode.EQUALS):
+                    a, b = parameter(idx, at + 1, modes[0]), parameter(idx, at + 2, modes[1])
+                    if opcode == Opcode.ADD:
+                        values = a + b
+                        wrapped = ((a ^ values) & (b ^ values)) < 0 # sign flipped both ways
+                    elif opcode == Opcode.MULTIPLY:
+                        values = a * b
+                        wrapped = np.abs(a.astype(np.float64) * b.astype(np.float64)) >= INT64_SAFE
+                    elif opcode == Opcode.LESS_THAN:
+                        values, wrapped = (a < b).astype(np.int64), None
+                    else:
+                        values, wrapped = (a == b).astype(np.int64), None
+                    if wrapped is not None and wrapped.any():
+                        fallback(idx[wrapped])
+                        idx, at, values = idx[~wrapped], at[~wrapped], values[~wrapped]
+                    write(idx, at + 3, modes[2], values)
+                elif opcode == Opcode.STORE_INPUT:
+                    waiting = input_read[idx] >= input_counts[idx]
+                    for lane in idx[waiting].tolist():
+                        active[lane] = False
+                        status[lane] = Status.NEEDS_INPUT
+                    idx, at = idx[~waiting], at[~waiting]
+                    write(idx, at + 1, modes[0], input_table[idx, input_read[idx]])
+                    input_read[idx] += 1
+                elif opcode == Opcode.SEND_TO_OUTPUT:
+                    for lane, value in zip(idx.tolist(), parameter(idx, at + 1, modes[0]).tolist()):
+                        outputs[lane].append(value)
+                elif opcode in (Opcode.JUMP_IF_TRUE, Opcode.JUMP_IF_FALSE):
+                    test = parameter(idx, at + 1, modes[0]) != 0
+                    if opcode == Opcode.JUMP_IF_FALSE:
+                        test = ~test
+                    pc[idx] = np.where(test, parameter(idx, at + 2, modes[1]), at + 3)
+                    continue
+                elif opcode == Opcode.ADJUST_RELATIVE_BASE:
+                    rb[idx] += parameter(idx, at + 1, modes[0])
+            except _Fallback:
+                fallback(idx)
+                continue
+            pc[idx] = at + inst.width
+    for lane in np.flatnonzero(active).tolist():
+        status[lane] = Status.SUSPENDED
+
+    machines = {}
+    for lane in overflowed:
+        machine = Intcode(program)
+        for address, value in patches[lane].items():
+            machine.poke(address, value)
+        machine.inputs.extend(inputs[lane])
+        # rerun from the start: max_steps is the steps the lane had left plus the ones it runs again
+        status[lane] = machine.run(budget=max_steps)
+        outputs[lane] = machine.outputs
+        machines[lane] = machine
+    return BatchResult(outputs=outputs, status=status, memory=memory, overflowed=sorted(overflowed),
+                       machines=machines, steps=steps)
+
+# day05 compare to 8 on three inputs, lanes take different branches
+_COMPARE_TO_8 = [3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
+                 999,1105,1,46,1101,1000,1,20,4,20,1105,1,46,98,99]
+_result = run_batch(_COMPARE_TO_8, inputs=[[7], [8], [9], []])
+assert _result.outputs == [[999], [1000], [1001], []]
+assert _result.status == [Status.HALTED] * 3 + [Status.NEEDS_INPUT]
+
+# day02 example over a noun/verb grid
+_result = run_batch([1,9,10,3,2,3,11,0,99,30,40,50], patches=[{1: 9, 2: 10}, {1: 10, 2: 10}])
+assert [_result.value(lane, 0) for lane in range(2)] == [3500, 4000]
+
+# day09: 16 digit products fit, the relative quine works per lane, a bigger product falls back
+_result = run_batch([1102,34915192,34915192,7,4,7,99,0], inputs=[[]])
+assert _result.outputs == [[1219070632396864]] and _result.overflowed == []
+_result = run_batch([1102,3491519200,3491519200,7,4,7,99,0], inputs=[[]])
+assert _result.outputs == [[3491519200 ** 2]] and _result.overflowed == [0]
+_QUINE = [109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99]
+assert run_batch(_QUINE, inputs=[[], []]).outputs == [_QUINE, _QUINE]
+
+# values past int64 in an input or in the program itself: those lanes (all, for the program) use Python ints
+_result = run_batch([3,5,4,5,99,0], inputs=[[2 ** 70], [5]])
+assert _result.outputs == [[2 ** 70], [5]] and _result.overflowed == [0]
+_result = run_batch([104, 2 ** 70, 99], inputs=[[], []])
+assert _result.outputs == [[2 ** 70]] * 2 and _result.overflowed == [0, 1]
+assert run_batch([1,9,10,3,2,3,11,0,99,30,40,50], patches=[{1: 9}, {9: -2 ** 64}]).value(1, 3) == 40 - 2 ** 64
+
+# lanes out of steps are suspended on either engine: lane 0 loops in the arrays,
+# lane 1 overflows then loops on Python ints, lane 2 halts
+_result = run_batch([1005,20,6,1105,1,3,1102,3491519200,3491519200,21,1105,1,10,99,0,0,0,0,0,0,0,0],
+                    patches=[{}, {20: 1}, {3: 99}], max_steps=50)
+assert _result.status == [Status.SUSPENDED, Status.SUSPENDED, Status.HALTED] and _result.steps == 50
+assert _result.overflowed == [1] and _result.machines[1].instructions == 50
@@ -0,0 +1,234 @@
+"""
+Static disassembly and control-flow graph of Intcode programs
+
+disassemble follows the code from address 0 (recursive descent): fall through, static jump
+targets (immediate mode), and when some jump is dynamic the likely targets landing on a valid
+instruction: the initial value of a position mode target cell, and the constants the program
+builds with immediate adds / multiplies (return addresses pushed before a call).
+Basic blocks start at those entries and after every jump, blocks end at a jump or a halt.
+Cells no reached instruction covers are data. Writes landing on code (self-modification),
+writes through the relative base and the relative base adjustments are listed.
+Results are cached per program hash, engines (the JIT) ask for the same analysis.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import NamedTuple, List, Dict, Tuple, Optional, Set
+from intcode import DECODE_TABLE, Opcode, WRITES
+
+CACHE_SIZE = 64 # disassemblies kept
+
+class Decoded(NamedTuple):
+    address: int
+    opcode: Opcode
+    modes: Tuple[int, ...] # one per parameter
+    params: Tuple[int, ...]
+    width: int
+
+class Block(NamedTuple):
+    start: int
+    end: int # address after the last instruction
+    successors: Tuple[int, ...] # static successors, taken target first
+    dynamic: bool # ends in a jump whose target is only known at run time
+
+class Disassembly(NamedTuple):
+    instructions: Dict[int, Decoded] # reached instructions by address
+    blocks: Dict[int, Block] # by start
+    data: List[range] # cells outside every reached instruction
+    self_modifying: List[Tuple[int, int]] # (writer address, code address written)
+    relative_writes: List[int] # addresses of instructions writing through the relative base
+    relative_base: List[Tuple[int, Optional[int]]] # (address, adjustment), None when not immediate
+    dynamic_jumps: List[int] # addresses of jumps with a position / relative target
+    unknown_code: List[int] # addresses reached that don't hold an instruction (yet)
+
+def decode_at(program: List[int], address: int) -> Optional[Decoded]:
+    """The instruction at address, None when the word isn't one or its parameters run off the end"""
+    if not 0 <= address < len(program):
+        return None
+    inst = DECODE_TABLE.get(program[address])
+    if inst is None or address + inst.width > len(program):
+        return None
+    params = tuple(program[address + 1:address + inst.width])
+    return Decoded(address, inst.opcode, inst.modes[:len(params)], params, inst.width)
+
+def linear_sweep(program: List[int]) -> List[Decoded]:
+    """Every cell decoded in order, skipping one cell at a time over what isn't an instruction"""
+    instructions, address = [], 0
+    while address < len(program):
+        decoded = decode_at(program, address)
+        if decoded is None:
+            address += 1
+        else:
+            instructions.append(decoded)
+            address += decoded.width
+    return instructions
+
+def _jump(decoded: Decoded) -> Tuple[Optional[bool], Optional[int]]:
+    """(whether it is always taken, None if conditional) and the static target"""
+    (cond_mode, target_mode), (cond, target) = decoded.modes, decoded.params
+    always = None
+    if cond_mode == 1:
+        always = bool(cond) == (decoded.opcode == Opcode.JUMP_IF_TRUE)
+    return always, target if target_mode == 1 else None
+
+def _constant(decoded: Decoded) -> Optional[int]:
+    """Value written by an add / multiply of two immediates"""
+    if decoded.opcode in (Opcode.ADD, Opcode.MULTIPLY) and decoded.modes[:2] == (1, 1):
+        a, b = decoded.params[:2]
+        return a + b if decoded.opcode == Opcode.ADD else a * b
+    return None
+
+def _descend(program: List[int], entries: List[int], instructions: Dict[int, Decoded],
+             leaders: Set[int], dynamic_jumps: List[int], unknown: Set[int]) -> None:
+    work = list(entries)
+    while work:
+        address = work.pop()
+        while address not in instructions:
+            decoded = decode_at(program, address)
+            if decoded is None:
+                unknown.add(address) # the program would crash, unless it writes code there first
+                break
+            instructions[address] = decoded
+            if decoded.opcode == Opcode.PROGRAM_HALT:
+                break
+            if decoded.opcode in (Opcode.JUMP_IF_TRUE, Opcode.JUMP_IF_FALSE):
+                always, target = _jump(decoded)
+                if target is None:
+                    dynamic_jumps.append(address)
+                elif always is not False:
+                    leaders.add(target)
+                    work.append(target)
+                if always:
+                    break
+                leaders.add(address + decoded.width)
+            address += decoded.width
+
+def _analyse(program: List[int]) -> Disassembly:
+    instructions: Dict[int, Decoded] = {}
+    leaders, dynamic_jumps, unknown = {0}, [], set()
+    _descend(program, [0], instructions, leaders, dynamic_jumps, unknown)
+    seen: Set[int] = set()
+    while dynamic_jumps:
+        # constants already reached are ordinary flow rather than return sites
+        values = {_constant(decoded) for decoded in instructions.values()} - set(instructions)
+        for address in dynamic_jumps:
+            decoded = instructions[address]
+            if decoded.modes[1] == 0 and 0 <= decoded.params[1] < len(program):
+                values.add(program[decoded.params[1]])
+        candidates = {value for value in values
+                      if value is not None and value not in seen and decode_at(program, value) is not None}
+        if not candidates:
+            break
+        seen |= candidates
+        leaders |= candidates
+        _descend(program, sorted(candidates), instructions, leaders, dynamic_jumps, unknown)
+
+    blocks: Dict[int, Block] = {}
+    start = None
+    for address in sorted(instructions):
+        decoded = instructions[address]
+        if start is None or address in leaders:
+            start = address
+        end = address + decoded.width
+        successors, dynamic = (), False
+        if decoded.opcode in (Opcode.JUMP_IF_TRUE, Opcode.JUMP_IF_FALSE):
+            always, target = _jump(decoded)
+            dynamic = target is None
+            successors = tuple(([] if always is False or target is None else [target]) +
+                               ([] if always else [end]))
+        elif decoded.opcode != Opcode.PROGRAM_HALT:
+            if end in instructions and end not in leaders:
+                continue # the block goes on
+            successors = (end,) if end in instructions else ()
+        blocks[start] = Block(start, end, successors, dynamic)
+        start = None
+
+    code = set()
+    for decoded in instructions.values():
+        code.update(range(decoded.address, decoded.address + decoded.width))
+    data, run = [], None
+    for address in range(len(program)):
+        if address in code:
+            if run is not None:
+                data.append(range(run, address))
+                run = None
+        elif run is None:
+            run = address
+    if run is not None:
+        data.append(range(run, len(program)))
+
+    self_modifying, relative_writes, relative_base = [], [], []
+    for address in sorted(instructions):
+        decoded = instructions[address]
+        if decoded.opcode in WRITES:
+            n = WRITES[decoded.opcode] - 1
+            if decoded.modes[n] == 2:
+                relative_writes.append(address)
+            elif decoded.params[n] in code or decoded.params[n] in unknown:
+                self_modifying.append((address, decoded.params[n]))
+        if decoded.opcode == Opcode.ADJUST_RELATIVE_BASE:
+            relative_base.append((address, decoded.params[0] if decoded.modes[0] == 1 else None))
+    return Disassembly(instructions=instructions, blocks=blocks, data=data, self_modifying=self_modifying,
+                       relative_writes=relative_writes, relative_base=relative_base,
+                       dynamic_jumps=sorted(set(dynamic_jumps)), unknown_code=sorted(unknown))
+
+_CACHE: 'OrderedDict[str, Disassembly]' = OrderedDict()
+
+def program_hash(program: List[int]) -> str:
+    return hashlib.sha256(",".join(map(str, program)).encode()).hexdigest()
+
+def disassemble(program: List[int]) -> Disassembly:
+    """Disassembly of program, computed once per program hash (least recently used dropped first)"""
+    key = program_hash(program)
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+        return _CACHE[key]
+    result = _analyse(list(program))
+    _CACHE[key] = result
+    if len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return result
+
+def listing(program: List[int]) -> str:
+    """Readable disassembly: blocks with their successors, instructions, data ranges"""
+    result = disassemble(program)
+    modifies = {address for address, _ in result.self_modifying}
+    lines = []
+    for block in sorted(result.blocks.values()):
+        successors = ", ".join(map(str, block.successors)) + (" + dynamic" if block.dynamic else "")
+        lines.append(f"block {block.start}-{block.end - 1} -> {successors or 'halt'}")
+        address = block.start
+        while address < block.end:
+            decoded = result.instructions[address]
+            operands = ", ".join(("#" if mode == 1 else "rb+" if mode == 2 else "@") + str(param)
+                                 for mode, param in zip(decoded.modes, decoded.params))
+            note = "  ; writes code" if address in modifies else ""
+            lines.append(f"  {address:>6}: {decoded.opcode.name:<21}{operands}{note}")
+            address += decoded.width
+    for cells in result.data:
+        lines.append(f"data {cells.start}-{cells.stop - 1}: {program[cells.start:cells.stop][:8]}"
+                     f"{' ...' if len(cells) > 8 else ''}")
+    return "\n".join(lines)
+
+# day05 jump example: the target is read from cell 15, its value 9 is followed
+_result = disassemble([3, 12, 6, 12, 15, 1, 13, 14, 13, 4, 13, 99, -1, 0, 1, 9])
+assert _result.blocks == {0: Block(0, 5, (5,), True), 5: Block(5, 9, (9,), False), 9: Block(9, 12, (), False)}
+assert _result.data == [range(12, 16)] and _result.dynamic_jumps == [2] and _result.self_modifying == []
+# an always taken jump over data
+_result = disassemble([3, 3, 1105, -1, 9, 1101, 0, 0, 12, 4, 12, 99, 1])
+assert _result.blocks == {0: Block(0, 5, (9,), False), 9: Block(9, 12, (), False)}
+assert _result.data == [range(5, 9), range(12, 13)] and _result.self_modifying == [(0, 3)]
+# day02 example writes into its own code, 1002 patches its own operand into a halt
+assert disassemble([1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50]).self_modifying == [(0, 3), (4, 0)]
+assert disassemble([1002, 4, 3, 4, 33]).self_modifying == [(0, 4)]
+# a call through the relative base: the return address pushed by 21101 is followed
+_result = disassemble([109, 20, 21101, 9, 0, 0, 1105, 1, 12, 4, 20, 99, 109, 1, 2106, 0, -1] + [0] * 4)
+assert 9 in _result.instructions and _result.dynamic_jumps == [14] and _result.relative_writes == [2]
+assert _result.relative_base == [(0, 20), (12, 1)] and _result.blocks[12] == Block(12, 17, (), True)
+assert _result.blocks[0] == Block(0, 9, (12,), False) and _result.data == [range(17, 21)]
+assert disassemble([1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50]) is disassemble([1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50])
+
+if __name__ == "__main__":
+    import sys
+    from intcode_image import load_program
+    print(listing(load_program(sys.argv[1] if len(sys.argv) > 1 else "day09_puzzle.txt")))
@@ -0,0 +1,275 @@
+"""
+Compiled Intcode program images
+
+An image is a 32 byte header, the program as packed int64 cells, then a side table for the
+cells that don't fit in int64 (stored as 0 in the array):
+
+    header   magic b"ICIM", version u16, flags u16 (bit 0: cells are big endian),
+             cell count u64, overflow entries u64, overflow table offset u64
+    cells    cell count x int64
+    overflow per entry: address u64, byte length u32, then the value as signed little endian bytes
+
+Images are opened with mmap, Image.cells is a memoryview over the mapping so nothing is copied
+until the program is turned into a list. load_program caches text programs as images
+keyed by the sha256 of the text, the first load parses and writes the image.
+Text is parsed in chunks (tokenize, iter_program), so loading a huge program needs
+its memory plus one chunk instead of the text, its split and the list.
+"""
+
+import hashlib
+import itertools
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import List, Dict, Iterable, Iterator, Union, BinaryIO
+from intcode import Intcode, Memory, Status, problem_prep
+
+MAGIC = b"ICIM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQQ")
+OVERFLOW_ENTRY = struct.Struct("<QI")
+BIG_ENDIAN = 1
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+IMAGE_SUFFIX = ".icim"
+CACHE_DIR = ".intcode_cache" # next to the text program unless load_program is given one
+CHUNK_SIZE = 1 << 20 # bytes of text parsed at a time
+
+PathLike = Union[str, Path]
+
+class ImageError(Exception): pass
+
+def _chunk_ints(chunks: Iterable[str]) -> Iterator[Iterator[int]]:
+    partial = ""
+    for chunk in chunks:
+        pieces = (partial + chunk).split(",")
+        partial = pieces.pop() # may be cut in the middle, completed by the next chunk
+        yield map(int, pieces)
+    if partial.strip():
+        yield iter([int(partial)])
+
+def tokenize(chunks: Iterable[str]) -> Iterator[int]:
+    """
+    Ints of comma separated text arriving in chunks, a number can be split across chunks.
+    Each chunk is split and converted at C speed, only the last piece is carried over
+    """
+    return itertools.chain.from_iterable(_chunk_ints(chunks))
+
+def read_chunks(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        yield chunk.decode("ascii")
+
+def iter_program(path: PathLike, chunk_size: int = CHUNK_SIZE) -> Iterator[int]:
+    """The program of a text file, streamed; Intcode and Memory take it as is"""
+    with open(path, 'rb') as file:
+        yield from tokenize(read_chunks(file, chunk_size))
+
+def read_memory(path: PathLike, chunk_size: int = CHUNK_SIZE) -> Memory:
+    """
+    Memory filled straight from the text file, chunk by chunk without a generator per int.
+    Intcode(read_memory(path)) runs on it as is
+    """
+    with open(path, 'rb') as file:
+        return Memory(tokenize(read_chunks(file, chunk_size)))
+
+def write_image(program: Iterable[int], path: PathLike) -> None:
+    """Writes program as an image, atomically so a reader never sees half a file"""
+    program = list(program)
+    overflow: Dict[int, int] = {}
+    try:
+        cells = array('q', program)
+    except OverflowError:
+        cells = array('q')
+        for address, value in enumerate(program):
+            if INT64_MIN <= value <= INT64_MAX:
+                cells.append(value)
+            else:
+                cells.append(0)
+                overflow[address] = value
+    table = bytearray()
+    for address, value in overflow.items():
+        raw = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+        table += OVERFLOW_ENTRY.pack(address, len(raw)) + raw
+    flags = BIG_ENDIAN if sys.byteorder == 'big' else 0
+    header = HEADER.pack(MAGIC, VERSION, flags, len(cells), len(overflow), HEADER.size + 8 * len(cells))
+    path = Path(path)
+    partial = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(partial, 'wb') as file:
+        file.write(header)
+        file.write(cells.tobytes())
+        file.write(table)
+    os.replace(partial, path)
+
+class Image:
+    """
+    A program image mapped read only. cells is an int64 memoryview over the file
+    (a copy only when the image was written on a machine of the other byte order),
+    overflow the cells the int64 array holds as 0
+    """
+    def __init__(self, path: PathLike):
+        with open(path, 'rb') as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file, mmap won't map it
+                raise ImageError(f"{path} is empty") from None
+        try:
+            magic, version, flags, size, entries, offset = HEADER.unpack_from(self._map)
+        except struct.error:
+            self._map.close()
+            raise ImageError(f"{path} is too short to be an image") from None
+        if magic != MAGIC or version != VERSION or offset != HEADER.size + 8 * size or offset > len(self._map):
+            self._map.close()
+            raise ImageError(f"{path} is not a version {VERSION} Intcode image")
+        self._view = memoryview(self._map)
+        raw = self._view[HEADER.size:offset]
+        if (flags & BIG_ENDIAN) == (sys.byteorder == 'big'):
+            self.cells = raw.cast('q')
+            raw.release() # the cast view holds the buffer on its own
+        else:
+            swapped = array('q', raw.tobytes())
+            swapped.byteswap()
+            raw.release()
+            self.cells = memoryview(swapped)
+        self.overflow: Dict[int, int] = {}
+        for _ in range(entries):
+            try:
+                address, length = OVERFLOW_ENTRY.unpack_from(self._map, offset)
+            except struct.error:
+                self.close()
+                raise ImageError(f"{path} is cut short in its overflow table") from None
+            offset += OVERFLOW_ENTRY.size
+            if offset + length > len(self._map):
+                self.close()
+                raise ImageError(f"{path} is cut short in its overflow table")
+            self.overflow[address] = int.from_bytes(self._map[offset:offset + length], 'little', signed=True)
+            offset += length
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __getitem__(self, address: int) -> int:
+        if address in self.overflow:
+            return self.overflow[address]
+        return self.cells[address]
+
+    def tolist(self) -> List[int]:
+        program = self.cells.tolist()
+        for address, value in self.overflow.items():
+            program[address] = value
+        return program
+
+    def close(self) -> None:
+        self.cells.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self) -> 'Image':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def load_program(path: PathLike, cache_dir: PathLike = None) -> List[int]:
+    """
+    Program from an image or a comma separated text file. Text goes through the image cache:
+    the image named after the text's sha256 is loaded if present, else the text is parsed once and cached
+    """
+    path = Path(path)
+    if path.suffix == IMAGE_SUFFIX:
+        with Image(path) as image:
+            return image.tolist()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    cache = Path(cache_dir) if cache_dir is not None else path.parent / CACHE_DIR
+    cached = cache / (digest.hexdigest() + IMAGE_SUFFIX)
+    if cached.exists():
+        try:
+            with Image(cached) as image:
+                return image.tolist()
+        except ImageError:
+            pass # written by another version, rebuilt below
+    program = read_memory(path).cells
+    try:
+        cache.mkdir(parents=True, exist_ok=True)
+        write_image(program, cached)
+    except OSError:
+        pass # read only checkout or full disk: the text is parsed again next time
+    return program
+
+# numbers cut anywhere by the chunk boundaries
+_text = "3,225,-1,1125899906842624,-99999,0,99\n"
+for _size in range(1, len(_text) + 1):
+    _chunks = [_text[i:i + _size] for i in range(0, len(_text), _size)]
+    assert list(tokenize(_chunks)) == problem_prep(_text), _size
+assert list(tokenize([])) == [] and list(tokenize(["1", "2,", "3"])) == [12, 3]
+
+# round trip with cells past int64, then through the text cache
+with tempfile.TemporaryDirectory() as _directory:
+    _program = [104, 1125899906842624, 104, -2 ** 64 - 5, 1102, 2 ** 63, 1, 0, 99]
+    write_image(_program, Path(_directory) / "program.icim")
+    with Image(Path(_directory) / "program.icim") as _image:
+        assert _image.tolist() == _program and _image.overflow == {3: -2 ** 64 - 5, 5: 2 ** 63}
+        assert _image[1] == 1125899906842624 and len(_image) == len(_program)
+    (Path(_directory) / "program.txt").write_text(",".join(map(str, _program)) + "\n")
+    assert load_program(Path(_directory) / "program.txt") == _program # parses and caches
+    assert len(list((Path(_directory) / CACHE_DIR).iterdir())) == 1
+    assert load_program(Path(_directory) / "program.txt") == _program # from the image
+    # an empty or cut short cache file is rebuilt, a cache that can't be written is skipped
+    _cached = next((Path(_directory) / CACHE_DIR).iterdir())
+    _image_bytes = _cached.read_bytes()
+    for _broken in (b"", _image_bytes[:-3]):
+        _cached.write_bytes(_broken)
+        try:
+            Image(_cached)
+        except ImageError:
+            pass
+        else:
+            raise AssertionError("a broken image was opened")
+        assert load_program(Path(_directory) / "program.txt") == _program and _cached.read_bytes() == _image_bytes
+    (Path(_directory) / "not_a_directory").write_text("")
+    assert load_program(Path(_directory) / "program.txt", Path(_directory) / "not_a_directory") == _program
+    _memory = read_memory(Path(_directory) / "program.txt", chunk_size=3)
+    assert _memory.cells == _program and list(_memory) == _program
+    _machine = Intcode(_memory) # runs on the memory it was given, no copy
+    assert _machine.run() == Status.HALTED and _machine.outputs == [1125899906842624, -2 ** 64 - 5]
+    assert _machine.program is _memory and _memory[0] == 2 ** 63
+
+if __name__ == "__main__":
+    # a generated program of a few million cells: text parse against image load
+    import time
+    with tempfile.TemporaryDirectory() as directory:
+        program = [1101, 2 ** 40, 3, 0] * 1_000_000 + [99, 2 ** 70]
+        text = Path(directory) / "big.txt"
+        text.write_text(",".join(map(str, program)))
+        start = time.perf_counter()
+        assert problem_prep(text.read_text()) == program
+        parsed = time.perf_counter() - start
+        load_program(text, directory) # first load writes the image
+        start = time.perf_counter()
+        assert load_program(text, directory) == program
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        with Image(next(Path(directory).glob("*" + IMAGE_SUFFIX))) as image:
+            opened = time.perf_counter() - start
+            assert image[len(program) - 1] == 2 ** 70
+        print(f"{len(program)} cells: parse text {parsed * 1000:.1f} ms, "
+              f"load cached image {loaded * 1000:.1f} ms, map image {opened * 1e6:.0f} us")
+
+        # peak memory over the program itself: whole text parse against the streaming tokenizer
+        import tracemalloc
+        for name, load in (("problem_prep", lambda: Memory(problem_prep(text.read_text()))),
+                           ("read_memory", lambda: read_memory(text))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            memory = load()
+            seconds = time.perf_counter() - start
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert memory.cells == program
+            del memory
+            print(f"{name:>12}: {seconds * 1000:.0f} ms, peak {peak / 2 ** 20:.0f} MB for {size / 2 ** 20:.0f} MB of memory")
@@ -0,0 +1,247 @@
+"""
+Symbolic (concolic) evaluation of Intcode programs
+
+Unknown memory cells and values read by opcode 3 become variables, values computed from them
+are expression trees. The program follows one concrete path (variables take the values in
+concrete_values, else the cell's own value or the given input) while recording where that path depended on a variable:
+branch conditions, jump targets, write addresses and instruction words.
+When nothing did (exact), the final memory and outputs are closed forms valid for every input.
+"""
+
+from typing import NamedTuple, List, Dict, Tuple, Union, Optional, Set, Iterable
+from intcode import DECODE_TABLE, Opcode, Status
+
+class Expr(NamedTuple):
+    op: str # 'var', 'load', '+', '*', '<', '=='
+    args: tuple
+    value: int # concrete value on the path taken
+
+Value = Union[int, Expr]
+
+class Condition(NamedTuple):
+    pos: int
+    expr: Expr
+    taken: bool
+
+class Forced(NamedTuple):
+    pos: int
+    what: str # 'instruction', 'jump target' or 'write address'
+    expr: Expr
+
+class Analysis(NamedTuple):
+    status: Status
+    memory: Dict[int, Value] # cells holding an expression at the end, plus every cell written
+    outputs: List[Value]
+    conditions: List[Condition] # branch conditions that depended on a variable
+    concretized: List[Forced] # other places a variable was forced to its value on the path
+    output_conditions: List[Tuple[int, int]] # number of conditions and forced values before each output
+    exact: bool # no branch, address or code depended on a variable
+
+    def depends(self) -> Dict[int, Set[str]]:
+        """
+        Variables each output depends on: the ones in its expression
+        and the ones in the branch conditions and forced values before it
+        """
+        result = {}
+        for n, output in enumerate(self.outputs):
+            names = variables(output)
+            conditions, forced = self.output_conditions[n]
+            for earlier in self.conditions[:conditions] + self.concretized[:forced]:
+                names |= variables(earlier.expr)
+            result[n] = names
+        return result
+
+class SymbolicError(Exception): pass
+
+def var(name: str, value: int = 0) -> Expr:
+    return Expr('var', (name,), value)
+
+def concrete(value: Value) -> int:
+    return value.value if type(value) is Expr else value
+
+def _apply(op: str, a: int, b: int) -> int:
+    if op == '+':
+        return a + b
+    elif op == '*':
+        return a * b
+    elif op == '<':
+        return 1 if a < b else 0
+    elif op == '==':
+        return 1 if a == b else 0
+    raise ValueError(f"unknown operator {op}")
+
+def combine(op: str, a: Value, b: Value) -> Value:
+    """Builds a op b, folding constants and the x + 0, x * 1, x * 0 identities"""
+    if type(a) is not Expr and type(b) is not Expr:
+        return _apply(op, a, b)
+    if op == '+':
+        if a == 0:
+            return b
+        if b == 0:
+            return a
+    elif op == '*':
+        if a == 0 or b == 0:
+            return 0
+        if a == 1:
+            return b
+        if b == 1:
+            return a
+    return Expr(op, (a, b), _apply(op, concrete(a), concrete(b)))
+
+def variables(value: Value) -> Set[str]:
+    if type(value) is not Expr:
+        return set()
+    if value.op == 'var':
+        return {value.args[0]}
+    if value.op == 'load':
+        address, cells = value.args
+        # any symbolic cell of the memory the load could hit
+        return variables(address).union(*(variables(cell) for cell in cells if type(cell) is Expr))
+    return variables(value.args[0]) | variables(value.args[1])
+
+def evaluate(value: Value, env: Dict[str, int]) -> int:
+    """Value of the expression for the variables in env"""
+    if type(value) is not Expr:
+        return value
+    if value.op == 'var':
+        return env[value.args[0]]
+    if value.op == 'load':
+        address, cells = value.args
+        address = evaluate(address, env)
+        return evaluate(cells[address], env) if 0 <= address < len(cells) else 0
+    return _apply(value.op, evaluate(value.args[0], env), evaluate(value.args[1], env))
+
+def linear_form(value: Value) -> Optional[Tuple[Dict[str, int], int]]:
+    """(coefficients, constant) when the expression is affine in its variables, else None"""
+    if type(value) is not Expr:
+        return {}, value
+    if value.op == 'var':
+        return {value.args[0]: 1}, 0
+    if value.op not in ('+', '*'):
+        return None
+    left, right = linear_form(value.args[0]), linear_form(value.args[1])
+    if left is None or right is None:
+        return None
+    if value.op == '+':
+        coefficients = dict(left[0])
+        for name, coefficient in right[0].items():
+            coefficients[name] = coefficients.get(name, 0) + coefficient
+        return coefficients, left[1] + right[1]
+    if left[0] and right[0]:
+        return None # product of two variables
+    (coefficients, constant), factor = (left, right[1]) if left[0] else (right, left[1])
+    return {name: coefficient * factor for name, coefficient in coefficients.items()}, constant * factor
+
+def analyse(program: List[int], unknown_cells: Dict[int, str] = None, inputs: Iterable[int] = (),
+            concrete_values: Dict[str, int] = None, max_steps: int = 1_000_000) -> Analysis:
+    """
+    Runs program with the cells in unknown_cells ({address: name}) as variables.
+    Opcode 3 reads variables in0, in1 ... whose values on the path come from inputs (0 once exhausted).
+    Stops when the program halts or after max_steps
+    """
+    unknown_cells = unknown_cells or {}
+    concrete_values = dict(concrete_values or {})
+    memory: List[Value] = list(program)
+    for address, name in unknown_cells.items():
+        if address >= len(memory):
+            memory.extend([0] * (address + 1 - len(memory)))
+        memory[address] = var(name, concrete_values.get(name, program[address] if address < len(program) else 0))
+    inputs = list(inputs)
+    written: Set[int] = set()
+    outputs: List[Value] = []
+    output_conditions: List[int] = []
+    conditions: List[Condition] = []
+    concretized: List[Forced] = []
+    pos, relative_base, inputs_read = 0, 0, 0
+
+    def force(value: Value, what: str) -> int:
+        if type(value) is Expr:
+            concretized.append(Forced(pos=pos, what=what, expr=value))
+            return value.value
+        return value
+
+    def read(address: Value) -> Value:
+        if type(address) is Expr:
+            # memory as it is now, the load is evaluated against it later
+            return Expr('load', (address, tuple(memory)), concrete(read(address.value)))
+        if address < 0:
+            raise SymbolicError(f"negative address {address} at pos {pos}")
+        return memory[address] if address < len(memory) else 0
+
+    def write(address: Value, value: Value) -> None:
+        address = force(address, 'write address')
+        if address < 0:
+            raise SymbolicError(f"negative address {address} at pos {pos}")
+        if address >= len(memory):
+            memory.extend([0] * (address + 1 - len(memory)))
+        memory[address] = value
+        written.add(address)
+
+    def parameter(n: int, mode: int) -> Value:
+        raw = read(pos + n)
+        if mode == 1:
+            return raw
+        elif mode == 0:
+            return read(raw)
+        return read(combine('+', raw, relative_base))
+
+    def location(n: int, mode: int) -> Value:
+        raw = read(pos + n)
+        return raw if mode == 0 else combine('+', raw, relative_base)
+
+    status = None
+    for _ in range(max_steps):
+        word = force(read(pos), 'instruction')
+        inst = DECODE_TABLE.get(word)
+        if inst is None:
+            raise SymbolicError(f"invalid opcode {word} at position {pos}")
+        opcode, modes = inst.opcode, inst.modes
+        if opcode == Opcode.PROGRAM_HALT:
+            status = Status.HALTED
+            break
+        elif opcode in (Opcode.ADD, Opcode.MULTIPLY, Opcode.LESS_THAN, Opcode.EQUALS):
+            op = {Opcode.ADD: '+', Opcode.MULTIPLY: '*', Opcode.LESS_THAN: '<', Opcode.EQUALS: '=='}[opcode]
+            write(location(3, modes[2]), combine(op, parameter(1, modes[0]), parameter(2, modes[1])))
+        elif opcode == Opcode.STORE_INPUT:
+            name = f"in{inputs_read}"
+            value = concrete_values.get(name, inputs[inputs_read] if inputs_read < len(inputs) else 0)
+            inputs_read += 1
+            write(location(1, modes[0]), var(name, value))
+        elif opcode == Opcode.SEND_TO_OUTPUT:
+            outputs.append(parameter(1, modes[0]))
+            output_conditions.append((len(conditions), len(concretized)))
+        elif opcode in (Opcode.JUMP_IF_TRUE, Opcode.JUMP_IF_FALSE):
+            test, target = parameter(1, modes[0]), parameter(2, modes[1])
+            taken = bool(concrete(test)) == (opcode == Opcode.JUMP_IF_TRUE)
+            if type(test) is Expr:
+                conditions.append(Condition(pos=pos, expr=test, taken=taken))
+            if taken:
+                pos = force(target, 'jump target')
+                continue
+        elif opcode == Opcode.ADJUST_RELATIVE_BASE:
+            relative_base = combine('+', relative_base, parameter(1, modes[0]))
+        pos += inst.width
+    else:
+        status = Status.NEEDS_INPUT # out of steps, the path was cut short
+
+    final = {address: memory[address] for address in range(len(memory))
+             if type(memory[address]) is Expr or address in written}
+    return Analysis(status=status, memory=final, outputs=outputs, conditions=conditions,
+                    concretized=concretized, output_conditions=output_conditions,
+                    exact=status == Status.HALTED and not conditions and not concretized)
+
+# day02 example with noun and verb unknown: they are addresses, position 0 reads through them
+_analysis = analyse([1,9,10,3,2,3,11,0,99,30,40,50], {1: 'noun', 2: 'verb'})
+assert _analysis.exact and concrete(_analysis.memory[0]) == 3500 # the path runs with the cells' own values
+assert evaluate(_analysis.memory[0], {'noun': 10, 'verb': 9}) == 3500 and evaluate(_analysis.memory[0], {'noun': 9, 'verb': 9}) == 30 * 2 * 50
+assert variables(_analysis.memory[0]) == {'noun', 'verb'}
+
+# position 0 ends as 3 * noun + verb
+_analysis = analyse([1,0,0,3,2,1,17,0,1,0,2,0,99,0,0,0,0,3], {1: 'noun', 2: 'verb'})
+assert _analysis.exact and linear_form(_analysis.memory[0]) == ({'noun': 3, 'verb': 1}, 0)
+
+# day05: compare the input to 8, the output depends on the input through a branch
+_analysis = analyse([3,9,8,9,10,9,4,9,99,-1,8], inputs=[8])
+assert _analysis.exact and evaluate(_analysis.outputs[0], {'in0': 7}) == 0
+_analysis = analyse([3,12,6,12,15,1,13,14,13,4,13,99,-1,0,1,9], inputs=[0])
+assert not _analysis.exact and _analysis.outputs == [0] and _analysis.depends() == {0: {'in0'}}
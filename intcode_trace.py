@@ -0,0 +1,154 @@
+"""
+Intcode execution traces on disk: dump, load, replay and diff
+
+A trace file is a 40 byte header, the records kept oldest first, then the values past int64:
+
+    header   magic b"ICTR", version u16, flags u16 (bit 0: records are big endian),
+             fields u32, ring size u64, records ever written u64, kept records u64
+    records  kept records x fields x int64 (pc, word, three operand cells, written address or -1, value)
+    big      per entry: record number u64, field u32, byte length u32, then the value as signed little endian bytes
+
+Record numbers count instructions from the start of the trace, so traces of two runs line up
+even when the ring dropped their beginnings. A trace that kept its first record can be replayed:
+the program is run again on the inputs it recorded and traced anew.
+"""
+
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+from intcode import Intcode, Trace, TraceRecord, TRACE_FIELDS, Status
+
+MAGIC = b"ICTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQQQ")
+BIG_ENTRY = struct.Struct("<QII")
+BIG_ENDIAN = 1
+
+PathLike = Union[str, Path]
+
+class TraceError(Exception): pass
+
+class TraceDiff(NamedTuple):
+    n: int # record number of the first difference
+    left: Optional[TraceRecord] # None when that trace stops before n
+    right: Optional[TraceRecord]
+
+def dump(trace: Trace, path: PathLike) -> None:
+    first = trace.first
+    slot = (first % trace.size) * TRACE_FIELDS
+    kept = len(trace) * TRACE_FIELDS
+    records = trace.buffer[slot:slot + kept]
+    records.extend(trace.buffer[:kept - len(records)]) # the part that wrapped around
+    big = bytearray()
+    entries = 0
+    for (n, field), value in sorted(trace.big.items()):
+        if n >= first:
+            raw = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+            big += BIG_ENTRY.pack(n, field, len(raw)) + raw
+            entries += 1
+    flags = BIG_ENDIAN if sys.byteorder == 'big' else 0
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, flags, TRACE_FIELDS, trace.size, trace.count, len(trace)))
+        records.tofile(file)
+        file.write(struct.pack("<Q", entries))
+        file.write(big)
+
+def load(path: PathLike) -> Trace:
+    data = Path(path).read_bytes()
+    try:
+        magic, version, flags, fields, size, count, kept = HEADER.unpack_from(data)
+    except struct.error:
+        raise TraceError(f"{path} is too short to be a trace") from None
+    if magic != MAGIC or version != VERSION or fields != TRACE_FIELDS or kept > min(size, count):
+        raise TraceError(f"{path} is not a version {VERSION} Intcode trace")
+    offset = HEADER.size + 8 * kept * fields
+    records = array('q', data[HEADER.size:offset])
+    if (flags & BIG_ENDIAN) != (sys.byteorder == 'big'):
+        records.byteswap()
+    trace = Trace(size)
+    trace.count = count
+    slot = ((count - kept) % size) * fields
+    head = min(len(records), len(trace.buffer) - slot)
+    trace.buffer[slot:slot + head] = records[:head]
+    trace.buffer[:len(records) - head] = records[head:]
+    entries, = struct.unpack_from("<Q", data, offset)
+    offset += 8
+    for _ in range(entries):
+        n, field, length = BIG_ENTRY.unpack_from(data, offset)
+        offset += BIG_ENTRY.size
+        trace.big[(n, field)] = int.from_bytes(data[offset:offset + length], 'little', signed=True)
+        offset += length
+    return trace
+
+def replay(program: List[int], trace: Trace, engine: Optional[str] = None) -> Trace:
+    """
+    Runs program again from the start on the inputs trace recorded, tracing into a ring of the same size.
+    Intcode programs are deterministic given their inputs, so diff shows where an engine or a patched program parts
+    """
+    if trace.first:
+        raise TraceError(f"the trace dropped its first {trace.first} records, their inputs are lost")
+    machine = Intcode(program, engine=engine)
+    machine.inputs.extend(trace.inputs())
+    replayed = machine.enable_tracing(trace.size)
+    machine.run()
+    return replayed
+
+def diff(left: Trace, right: Trace) -> Optional[TraceDiff]:
+    """First record number both traces kept where they differ, or where one of them stops; None if they agree"""
+    start = max(left.first, right.first)
+    for n in range(start, min(left.count, right.count)):
+        if left.raw(n) != right.raw(n):
+            return TraceDiff(n, left.record(n), right.record(n))
+    if left.count == right.count:
+        return None
+    n = max(start, min(left.count, right.count))
+    return TraceDiff(n, left.record(n) if n < left.count else None, right.record(n) if n < right.count else None)
+
+def format_record(record: Optional[TraceRecord]) -> str:
+    if record is None:
+        return "(stopped)"
+    write = f" -> [{record.address}] = {record.value}" if record.address is not None else ""
+    return f"{record.pc:>6}: {record.opcode.name:<21}{record.word:>6} {list(record.operands)}{write}"
+
+# day05 compare to 8: inputs 7 and 8 run the same code until the jump on the comparison
+_COMPARE_TO_8 = [3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
+                 999,1105,1,46,1101,1000,1,20,4,20,1105,1,46,98,99]
+_traces = []
+for _value in (7, 8):
+    _machine = Intcode(_COMPARE_TO_8)
+    _machine.inputs.append(_value)
+    _traces.append(_machine.enable_tracing(size=16))
+    assert _machine.run() == Status.HALTED
+assert diff(_traces[0], _traces[0]) is None
+_difference = diff(*_traces)
+assert _difference.n == 0 and _difference.left.value == 7 and _difference.right.value == 8
+assert diff(replay(_COMPARE_TO_8, _traces[1]), _traces[1]) is None
+
+# a wrapped ring with a value past int64 through a file, lined up with a longer ring of the same run
+import tempfile
+with tempfile.TemporaryDirectory() as _directory:
+    _program = [1102, 2 ** 40, 2 ** 40, 20, 1001, 21, 1, 21, 1007, 21, 10, 22, 1005, 22, 4, 4, 20, 99] + [0] * 5
+    _short, _long = Intcode(_program), Intcode(_program)
+    _short.enable_tracing(size=5)
+    _long.enable_tracing(size=64)
+    assert _short.run() == _long.run() == Status.HALTED and _short.outputs == [2 ** 80]
+    dump(_short.trace, Path(_directory) / "short.trace")
+    _loaded = load(Path(_directory) / "short.trace")
+    assert _loaded.records() == _short.trace.records() and _loaded.first == _short.trace.first > 0
+    assert diff(_loaded, _long.trace) is None and _long.trace.record(0).value == 2 ** 80
+    dump(_long.trace, Path(_directory) / "long.trace")
+    assert load(Path(_directory) / "long.trace").big == {(0, 6): 2 ** 80} # cells past the halt are stored as 0
+
+if __name__ == "__main__":
+    # python intcode_trace.py a.trace b.trace: the first divergence with a few records of context
+    left, right = load(sys.argv[1]), load(sys.argv[2])
+    difference = diff(left, right)
+    if difference is None:
+        print(f"traces agree over records {max(left.first, right.first)} to {left.count - 1}")
+    else:
+        for n in range(max(difference.n - 5, left.first, right.first), difference.n):
+            print(f"{n:>10}   {format_record(left.record(n))}")
+        print(f"{difference.n:>10} < {format_record(difference.left)}")
+        print(f"{difference.n:>10} > {format_record(difference.right)}")
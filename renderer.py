@@ -0,0 +1,158 @@
+"""
+Differential character screen shared by the Breakout cabinet (day13) and the hull painting robot (day11)
+
+The picture is a preallocated bytearray with one byte per cell and a newline ending every row,
+so the full frame is one decode + translate. set() only touches the byte and remembers the cell
+when its value changed; updates() turns the cells changed since the last call into ANSI cursor moves,
+runs of neighbours on a row sharing one move. Cells outside the screen grow it (and the next updates()
+redraws everything), so callers that don't know the extent (the robot) can start anywhere.
+With fps, updates() called sooner than a frame after the last one drawn drops the frame: it returns ""
+and the changes go out with the next frame that is drawn.
+"""
+
+import time
+from typing import Dict, Sequence, Tuple, Iterator, Optional, Callable
+
+OFFSET = 32 # cell byte = value + OFFSET, clear of the newline
+CLEAR, HOME = "\x1b[2J", "\x1b[H"
+
+class Renderer:
+    def __init__(self, width: int, height: int, palette: Sequence[str] = " #",
+                 origin: Tuple[int, int] = (0, 0), flip: bool = False,
+                 fps: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        palette[value] is the character drawn for a cell holding value, x, y start at origin.
+        flip puts the largest y on the first line (the robot's y goes up),
+        fps caps the frames updates() draws per second of clock
+        """
+        self.palette = palette
+        self._glyphs = {OFFSET + value: glyph for value, glyph in enumerate(palette)}
+        self.flip = flip
+        self._allocate(origin, width, height)
+        self.frames = 0 # updates() calls
+        self.skipped = 0 # frames dropped to keep under fps
+        self._interval = 1 / fps if fps else 0.0
+        self._clock = clock
+        self._shown = float('-inf') # clock when the last frame was drawn
+
+    def _allocate(self, origin: Tuple[int, int], width: int, height: int) -> None:
+        self.left, self.bottom = origin
+        self.width, self.height = width, height
+        self.stride = width + 1
+        row = bytes([OFFSET]) * width + b"\n"
+        self.buffer = bytearray(row * height)
+        self._changed: Dict[int, None] = {} # buffer index -> None, in the order cells changed
+        self._redraw = True
+
+    def _index(self, x: int, y: int) -> int:
+        row = y - self.bottom
+        if self.flip:
+            row = self.height - 1 - row
+        return row * self.stride + x - self.left
+
+    def _grow(self, x: int, y: int) -> None:
+        """Doubles the screen towards (x, y) until it fits, keeping what is drawn"""
+        left, bottom, width, height = self.left, self.bottom, self.width, self.height
+        while not left <= x < left + width:
+            if x < left:
+                left -= width
+            width *= 2
+        while not bottom <= y < bottom + height:
+            if y < bottom:
+                bottom -= height
+            height *= 2
+        cells = list(self.cells())
+        self._allocate((left, bottom), width, height)
+        for cx, cy, value in cells:
+            self.buffer[self._index(cx, cy)] = value + OFFSET
+
+    def set(self, x: int, y: int, value: int) -> None:
+        if not (self.left <= x < self.left + self.width and self.bottom <= y < self.bottom + self.height):
+            self._grow(x, y)
+        i = self._index(x, y)
+        byte = value + OFFSET
+        if self.buffer[i] != byte:
+            self.buffer[i] = byte
+            self._changed[i] = None
+
+    def get(self, x: int, y: int) -> int:
+        if not (self.left <= x < self.left + self.width and self.bottom <= y < self.bottom + self.height):
+            return 0
+        return self.buffer[self._index(x, y)] - OFFSET
+
+    def cells(self) -> Iterator[Tuple[int, int, int]]:
+        """(x, y, value) of every cell not holding 0"""
+        for i, byte in enumerate(self.buffer):
+            if byte != OFFSET and byte != 10:
+                row, column = divmod(i, self.stride)
+                yield (column + self.left,
+                       (self.height - 1 - row if self.flip else row) + self.bottom, byte - OFFSET)
+
+    def render(self) -> str:
+        """The whole screen, rows joined by newlines"""
+        return self.buffer[:-1].decode('ascii').translate(self._glyphs)
+
+    def updates(self) -> str:
+        """ANSI escapes redrawing the cells changed since the last frame drawn (all of them the first time)"""
+        self.frames += 1
+        if self._interval:
+            now = self._clock()
+            if now - self._shown < self._interval:
+                self.skipped += 1
+                return ""
+            self._shown = now
+        if self._redraw:
+            self._redraw = False
+            self._changed.clear()
+            return CLEAR + HOME + self.render().replace("\n", "\r\n")
+        if not self._changed:
+            return ""
+        parts = []
+        glyphs, buffer, stride = self._glyphs, self.buffer, self.stride
+        previous = -2
+        for i in sorted(self._changed):
+            if i != previous + 1:
+                row, column = divmod(i, stride)
+                parts.append(f"\x1b[{row + 1};{column + 1}H")
+            parts.append(glyphs.get(buffer[i], "?"))
+            previous = i
+        self._changed.clear()
+        return "".join(parts)
+
+    def crop(self) -> str:
+        """The smallest rectangle holding every cell not 0, rendered"""
+        cells = list(self.cells())
+        if not cells:
+            return ""
+        left, right = min(x for x, _, _ in cells), max(x for x, _, _ in cells)
+        low, high = min(y for _, y, _ in cells), max(y for _, y, _ in cells)
+        lines = []
+        for y in (range(high, low - 1, -1) if self.flip else range(low, high + 1)):
+            start = self._index(left, y)
+            lines.append(self.buffer[start:start + right - left + 1].decode('ascii').translate(self._glyphs))
+        return "\n".join(lines)
+
+# two changed cells on a row share a cursor move, an unchanged write sends nothing
+_screen = Renderer(4, 2, palette=" %█#O")
+_screen.set(0, 0, 1)
+assert _screen.updates() == CLEAR + HOME + "%   \r\n    " and _screen.render() == "%   \n    "
+_screen.set(1, 1, 2)
+_screen.set(2, 1, 4)
+_screen.set(0, 0, 1)
+assert _screen.updates() == "\x1b[2;2H█O" and _screen.updates() == ""
+# at 20 fps, frames asked for within 50 ms of the last one drawn are dropped, their changes wait
+_ticks = iter([0.0, 0.01, 0.02, 0.05, 0.06, 0.12])
+_screen = Renderer(3, 1, fps=20, clock=lambda: next(_ticks))
+assert _screen.updates() == CLEAR + HOME + "   "
+_screen.set(0, 0, 1)
+assert _screen.updates() == ""
+_screen.set(2, 0, 1)
+assert _screen.updates() == "" and _screen.updates() == "\x1b[1;1H#\x1b[1;3H#"
+assert _screen.updates() == "" and _screen.updates() == ""
+assert (_screen.frames, _screen.skipped) == (6, 3)
+# the robot's hull: y going up, starting at (0, 0) and growing to the left and down
+_hull = Renderer(2, 2, palette=" #", flip=True)
+for _x, _y in [(0, 0), (-1, 0), (-3, -2), (1, 1)]:
+    _hull.set(_x, _y, 1)
+assert _hull.get(-3, -2) == 1 and _hull.get(5, 5) == 0 and sorted(_hull.cells())[0] == (-3, -2, 1)
+assert _hull.crop() == "    #\n  ## \n     \n#    "